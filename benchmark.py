@@ -0,0 +1,340 @@
+# Đo hiệu năng và chất lượng tìm kiếm RAG, KHÔNG cần Streamlit hay GROQ_API_KEY.
+# Chạy bằng lệnh: python benchmark.py
+#   --warm            dùng chỉ mục đã lưu trong .rag_cache (đo thời gian tải) thay vì dựng mới
+#   --queries FILE    bộ câu hỏi (JSONL), mặc định benchmarks/retrieval_queries_v1.jsonl
+#   --output FILE     nơi lưu kết quả JSON, mặc định benchmarks/results/<thời điểm>.json
+#   --verify          chỉ KIỂM TRA kết quả: search() và search_batch() phải trùng với cách chấm điểm
+#                     "vét cạn" (cộng cả cột posting), trên bộ câu hỏi + VERIFY_RANDOM_QUERIES câu ngẫu nhiên;
+#                     sai lệch thì thoát với mã 1 (chạy lại mỗi khi sửa bm25_search.py)
+#
+# Mỗi dòng của bộ câu hỏi: {"id", "query", "expected": [{"source": tên file PDF, "pages": [...]}]}
+# Một chunk được tính là ĐÚNG nếu cùng file và khoảng trang của nó giao với "pages".
+# Kết quả gồm: thời gian dựng/tải chỉ mục, dung lượng chỉ mục trong RAM, độ trễ p50/p95/p99
+# mỗi câu hỏi, thông lượng khi chạy theo lô, recall@k và MRR (BM25 và kết hợp BM25 + LSA,
+# xem dense_index.py), và chất lượng / số token của bước chọn chunk gửi cho AI
+# (top-k thuần so với MMR + gộp chunk liền nhau, xem chunk_select.py).
+# Bộ câu hỏi diễn đạt khác sách (đo lợi ích của LSA): benchmarks/retrieval_queries_paraphrase_v1.jsonl
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import platform
+import tempfile
+
+import numpy as np
+
+from rag_index import INDEX_DIR, load_or_build_index
+from chunk_select import MMR_LAMBDA, select_chunks
+from context_packer import estimate_tokens
+
+DEFAULT_QUERIES = os.path.join("benchmarks", "retrieval_queries_v1.jsonl")
+DEFAULT_RESULTS_DIR = os.path.join("benchmarks", "results")
+RECALL_AT = (1, 3, 5, 10)
+SELECTION_MIN_RELATIVE_SCORE = 0.1 # <-- Giống RAG_MIN_RELATIVE_SCORE trong chatbot.py
+VERIFY_RANDOM_QUERIES = 2000 # <-- Số câu hỏi ngẫu nhiên (ghép từ chữ trong chunk) khi chạy --verify
+VERIFY_K = (1, 3, 10, 50)
+
+
+def load_queries(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def estimate_index_bytes(rag_index):
+    """
+    Ước lượng dung lượng RAM của chỉ mục: mảng numpy/scipy + từ điển + kho chunk
+    (kho chunk được mmap nên phần này dùng chung giữa các tiến trình).
+    """
+    bm25 = rag_index.bm25
+    total = bm25.postings.data.nbytes + bm25.postings.indices.nbytes + bm25.postings.indptr.nbytes
+    total += bm25.max_impact.nbytes + bm25.idf.nbytes
+    total += sys.getsizeof(bm25.vocabulary) + sum(sys.getsizeof(t) for t in bm25.vocabulary)
+    total += rag_index.chunk_store.nbytes()
+    return total
+
+
+def lexical_candidates(rag_index, query, k):
+    """Ứng viên như find_relevant_knowledge (chế độ "lexical"): top-k BM25 đạt ngưỡng tương đối."""
+    doc_ids, scores = rag_index.search(query, k=k)
+    max_score = rag_index.max_possible_score(query)
+    return [(i, s) for i, s in zip(doc_ids, scores)
+            if max_score > 0 and s / max_score >= SELECTION_MIN_RELATIVE_SCORE]
+
+
+def hybrid_candidates(rag_index, query, k):
+    """Ứng viên như find_relevant_knowledge (chế độ "hybrid"): BM25 + LSA gộp bằng RRF."""
+    doc_ids, scores = rag_index.hybrid_search(query, k=k, min_relative_score=SELECTION_MIN_RELATIVE_SCORE)
+    return list(zip(doc_ids, scores))
+
+
+def is_relevant(source, expected):
+    name, first, last = source
+    return any(
+        e["source"] == name and any(first <= p <= last for p in e["pages"])
+        for e in expected
+    )
+
+
+def evaluate_quality(rag_index, queries, depth=max(RECALL_AT), hybrid=False):
+    """
+    recall@k (tỉ lệ câu hỏi có ít nhất 1 chunk đúng trong top-k) và MRR@depth.
+    hybrid=True: xếp hạng bằng hybrid_search (không lọc ngưỡng) thay cho BM25.
+    """
+    hits = {k: 0 for k in RECALL_AT}
+    reciprocal_ranks = []
+    per_query = []
+    if hybrid:
+        results = [rag_index.hybrid_search(q["query"], k=depth) for q in queries]
+    else:
+        results = rag_index.search_batch([q["query"] for q in queries], k=depth)
+    for q, (doc_ids, _) in zip(queries, results):
+        rank = next(
+            (r for r, i in enumerate(doc_ids, 1) if is_relevant(rag_index.chunk_sources[i], q["expected"])),
+            None
+        )
+        for k in RECALL_AT:
+            hits[k] += rank is not None and rank <= k
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+        per_query.append({"id": q["id"], "first_relevant_rank": rank})
+    n = max(len(queries), 1)
+    return {
+        "recall": {f"@{k}": hits[k] / n for k in RECALL_AT},
+        "mrr": float(np.mean(reciprocal_ranks)) if reciprocal_ranks else 0.0,
+        "per_query": per_query,
+    }
+
+
+def evaluate_selection(rag_index, queries, num_chunks, candidates_fn=lexical_candidates, **select_options):
+    """
+    Đánh giá các đoạn thực sự gửi cho AI (như find_relevant_knowledge trong chatbot.py):
+    tỉ lệ câu hỏi có đoạn đúng, số chunk đúng trung bình, số token trung bình và chunk đúng / 1000 token.
+    """
+    hits, relevant, tokens = 0, 0, 0
+    for q in queries:
+        candidates = candidates_fn(rag_index, q["query"], num_chunks * 4)
+        spans = select_chunks(rag_index, [i for i, _ in candidates], [s for _, s in candidates],
+                              num_chunks=num_chunks, **select_options)
+        found = sum(is_relevant(rag_index.chunk_sources[i], q["expected"]) for span in spans for i in span.ids)
+        hits += found > 0
+        relevant += found
+        tokens += sum(estimate_tokens(span.text) for span in spans)
+    n = max(len(queries), 1)
+    return {
+        "hit_rate": hits / n,
+        "relevant_chunks": relevant / n,
+        "tokens": tokens / n,
+        "relevant_per_1k_tokens": relevant / tokens * 1000 if tokens else 0.0,
+    }
+
+
+def random_queries(rag_index, count, seed=0):
+    """Câu hỏi ngẫu nhiên: vài chữ liền nhau hoặc rời rạc lấy từ các chunk, thêm chữ không có trong kho."""
+    rng = np.random.default_rng(seed)
+    queries = []
+    for _ in range(count):
+        words = rag_index.all_chunks[int(rng.integers(len(rag_index.all_chunks)))].split()
+        if not words:
+            continue
+        size = int(rng.integers(1, 9))
+        if rng.random() < 0.5:
+            start = int(rng.integers(max(1, len(words) - size + 1)))
+            picked = words[start:start + size]
+        else:
+            picked = [words[int(i)] for i in rng.integers(len(words), size=size)]
+        if rng.random() < 0.2:
+            picked.append("xyzkhongco")
+        queries.append(" ".join(picked))
+    return queries
+
+
+def verify_search(rag_index, queries):
+    """
+    So search() (MaxScore) và search_batch() với điểm vét cạn postings[:, từ].sum(1).
+    Hai kết quả đúng khi cùng dãy điểm top-k (sai số float32) và điểm của từng chunk trả về khớp
+    điểm vét cạn (hòa điểm ở vị trí thứ k có thể chọn chunk khác). Trả về list lỗi (rỗng = đúng).
+    """
+    bm25 = rag_index.bm25
+    errors = []
+    for k in VERIFY_K:
+        batch_results = bm25.search_batch(queries, k=k)
+        for query, batch_result in zip(queries, batch_results):
+            term_ids = bm25.query_terms(query)
+            exact = np.asarray(bm25.postings[:, term_ids].sum(axis=1)).ravel() if term_ids.size else np.zeros(0)
+            expected = np.sort(exact[exact > 0])[::-1][:k]
+            for name, (doc_ids, scores) in (("search", bm25.search(query, k=k)), ("search_batch", batch_result)):
+                ok = (len(scores) == len(expected) and len(set(doc_ids.tolist())) == len(doc_ids)
+                      and np.allclose(scores, expected, rtol=1e-4, atol=1e-4)
+                      and np.allclose(exact[doc_ids], scores, rtol=1e-4, atol=1e-4))
+                if not ok:
+                    errors.append({"method": name, "k": k, "query": query})
+    return errors
+
+
+def measure_latency(rag_index, queries, k, repeat, search=None):
+    """Độ trễ từng câu hỏi (mili giây), chạy lặp lại repeat lần. search mặc định là rag_index.search."""
+    search = search or rag_index.search
+    for q in queries: # Làm nóng (cache tách từ, bộ nhớ đệm CPU)
+        search(q["query"], k=k)
+    samples = []
+    for _ in range(repeat):
+        for q in queries:
+            t0 = time.perf_counter()
+            search(q["query"], k=k)
+            samples.append((time.perf_counter() - t0) * 1000)
+    samples = np.asarray(samples)
+    return {
+        "samples": int(samples.size),
+        "mean_ms": float(samples.mean()),
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "p99_ms": float(np.percentile(samples, 99)),
+    }
+
+
+def measure_throughput(rag_index, queries, k, batch_size, repeat):
+    """Số câu hỏi/giây với lô batch_size câu: gọi search() lần lượt và gọi search_batch() một lần."""
+    texts = [q["query"] for q in queries]
+    batch = (texts * (batch_size // max(len(texts), 1) + 1))[:batch_size]
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for text in batch:
+            rag_index.search(text, k=k)
+    sequential = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        rag_index.search_batch(batch, k=k)
+    batched = time.perf_counter() - t0
+    return {
+        "batch_size": batch_size,
+        "queries_per_sec": batch_size * repeat / sequential if sequential else 0.0,
+        "batch_queries_per_sec": batch_size * repeat / batched if batched else 0.0,
+    }
+
+
+def run_benchmark(pdf_dir, queries_path, cache_dir, k, repeat, batch_size, max_workers):
+    queries = load_queries(queries_path)
+    with open(queries_path, "rb") as f:
+        queries_sha = hashlib.sha256(f.read()).hexdigest()
+
+    t0 = time.perf_counter()
+    rag_index = load_or_build_index(pdf_dir, cache_dir, max_workers=max_workers, build_dense=True)
+    ingest_seconds = time.perf_counter() - t0
+    if rag_index is None:
+        raise SystemExit(f"Không dựng được chỉ mục từ '{pdf_dir}'.")
+
+    result = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "queries": {"path": queries_path, "sha256": queries_sha, "count": len(queries)},
+        "index": {
+            "pdf_dir": pdf_dir,
+            "fingerprint": rag_index.fingerprint,
+            "chunks": len(rag_index.all_chunks),
+            "terms": len(rag_index.bm25.vocabulary),
+            "postings": int(rag_index.bm25.postings.nnz),
+            "memory_bytes": estimate_index_bytes(rag_index),
+            "ingest_seconds": ingest_seconds,
+        },
+        "k": k,
+        "latency": measure_latency(rag_index, queries, k, repeat),
+        "throughput": measure_throughput(rag_index, queries, k, batch_size, repeat),
+        "quality": evaluate_quality(rag_index, queries),
+        "selection": {
+            "top_k": evaluate_selection(rag_index, queries, k, mmr_lambda=1.0, max_span_chunks=1),
+            "mmr": evaluate_selection(rag_index, queries, k, mmr_lambda=MMR_LAMBDA),
+        },
+    }
+    if rag_index.dense is not None:
+        result["dense"] = {
+            "dim": int(rag_index.dense.doc_vectors.shape[1]),
+            "clusters": int(len(rag_index.dense.centroids)),
+            "memory_bytes": int(rag_index.dense.nbytes()),
+            "latency": measure_latency(rag_index, queries, k, repeat, search=rag_index.dense_search),
+        }
+        result["hybrid"] = {
+            "latency": measure_latency(rag_index, queries, k, repeat, search=rag_index.hybrid_search),
+            "quality": evaluate_quality(rag_index, queries, hybrid=True),
+        }
+        result["selection"]["hybrid_mmr"] = evaluate_selection(
+            rag_index, queries, k, candidates_fn=hybrid_candidates, mmr_lambda=MMR_LAMBDA
+        )
+    return result
+
+
+def print_report(result):
+    index, latency = result["index"], result["latency"]
+    quality = result["quality"]
+    print("\n=== KẾT QUẢ BENCHMARK RAG ===")
+    print(f"Chỉ mục: {index['chunks']} chunk, {index['terms']} từ, {index['postings']} posting, "
+          f"~{index['memory_bytes'] / 1e6:.1f} MB RAM, dựng/tải {index['ingest_seconds']:.2f}s")
+    print(f"Độ trễ ({latency['samples']} lần, k={result['k']}): p50 {latency['p50_ms']:.3f} ms, "
+          f"p95 {latency['p95_ms']:.3f} ms, p99 {latency['p99_ms']:.3f} ms")
+    print(f"Thông lượng (lô {result['throughput']['batch_size']}): "
+          f"{result['throughput']['queries_per_sec']:.0f} câu hỏi/giây (lần lượt), "
+          f"{result['throughput']['batch_queries_per_sec']:.0f} câu hỏi/giây (search_batch)")
+    recall = ", ".join(f"R{k}={v:.2f}" for k, v in quality["recall"].items())
+    print(f"Chất lượng ({result['queries']['count']} câu hỏi): {recall}, MRR={quality['mrr']:.3f}")
+    if "hybrid" in result:
+        dense, hybrid = result["dense"], result["hybrid"]
+        print(f"LSA: {dense['dim']} chiều, {dense['clusters']} cụm IVF, ~{dense['memory_bytes'] / 1e6:.1f} MB (mmap), "
+              f"p50 {dense['latency']['p50_ms']:.3f} ms; kết hợp BM25 + LSA: p50 {hybrid['latency']['p50_ms']:.3f} ms, "
+              f"p95 {hybrid['latency']['p95_ms']:.3f} ms")
+        recall = ", ".join(f"R{k}={v:.2f}" for k, v in hybrid["quality"]["recall"].items())
+        print(f"Chất lượng (kết hợp BM25 + LSA): {recall}, MRR={hybrid['quality']['mrr']:.3f}")
+    for name, sel in result["selection"].items():
+        print(f"Chọn {result['k']} chunk ({name}): có đoạn đúng {sel['hit_rate']:.2f}, "
+              f"{sel['relevant_chunks']:.2f} chunk đúng, ~{sel['tokens']:.0f} token, "
+              f"{sel['relevant_per_1k_tokens']:.2f} chunk đúng/1000 token")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark tìm kiếm RAG (không cần Streamlit/Groq).")
+    parser.add_argument("--pdf-dir", default="./PDF_KNOWLEDGE")
+    parser.add_argument("--queries", default=DEFAULT_QUERIES)
+    parser.add_argument("--warm", action="store_true", help=f"dùng chỉ mục đã lưu trong {INDEX_DIR}")
+    parser.add_argument("--workers", type=int, default=None, help="số tiến trình đọc PDF")
+    parser.add_argument("--k", type=int, default=3, help="số chunk lấy ra mỗi câu hỏi khi đo độ trễ")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--verify", action="store_true", help="chỉ kiểm tra search/search_batch so với chấm điểm vét cạn")
+    args = parser.parse_args(argv)
+
+    if args.verify:
+        rag_index = load_or_build_index(args.pdf_dir, INDEX_DIR, max_workers=args.workers)
+        if rag_index is None:
+            raise SystemExit(f"Không dựng được chỉ mục từ '{args.pdf_dir}'.")
+        queries = [q["query"] for q in load_queries(args.queries)] + random_queries(rag_index, VERIFY_RANDOM_QUERIES)
+        errors = verify_search(rag_index, queries)
+        for error in errors[:20]:
+            print(f"SAI: {error['method']} k={error['k']}: {error['query']!r}")
+        print(f"Kiểm tra {len(queries)} câu hỏi x k={VERIFY_K}: {len(errors)} sai lệch")
+        raise SystemExit(1 if errors else 0)
+
+    if args.warm:
+        result = run_benchmark(args.pdf_dir, args.queries, INDEX_DIR, args.k, args.repeat,
+                               args.batch_size, args.workers)
+    else:
+        # Dựng chỉ mục mới hoàn toàn trong thư mục tạm để đo thời gian nạp PDF "lạnh"
+        with tempfile.TemporaryDirectory(prefix="rag_bench_") as cache_dir:
+            result = run_benchmark(args.pdf_dir, args.queries, cache_dir, args.k, args.repeat,
+                                   args.batch_size, args.workers)
+    result["mode"] = "warm" if args.warm else "cold"
+
+    print_report(result)
+    output = args.output or os.path.join(DEFAULT_RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"Đã lưu kết quả: {output}")
+
+
+if __name__ == "__main__":
+    main()
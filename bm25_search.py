@@ -0,0 +1,213 @@
+# Tìm kiếm BM25 trên chỉ mục ngược (inverted index), có xử lý riêng cho tiếng Việt.
+# - Tách từ theo âm tiết; mỗi âm tiết sinh ra cả dạng CÓ dấu và dạng BỎ dấu
+#   (để câu hỏi gõ không dấu "bo nho" vẫn khớp "bộ nhớ"), cộng thêm cặp âm tiết
+#   liền nhau (bigram, dạng bỏ dấu) để ưu tiên đúng cụm từ.
+# - Danh sách posting của mỗi từ là một cột của ma trận thưa CSC (doc_id đã sắp xếp +
+#   điểm BM25 tính sẵn của từ đó trong từng chunk).
+# - Lấy top-k theo kiểu MaxScore: khi tổng điểm tối đa của các từ còn lại không thể đưa
+#   chunk mới nào vào top-k, chỉ còn chấm thêm các ứng viên đã có. Thời gian tìm kiếm
+#   phụ thuộc độ dài posting của các từ trong câu hỏi, không phụ thuộc kích thước kho.
+# - Nhiều câu hỏi cùng lúc (search_batch): một phép nhân ma trận thưa (câu hỏi x từ) @ (từ x chunk)
+#   rồi lấy top-k theo từng dòng bằng numpy (dùng cho đánh giá và tính trước câu hỏi gợi ý).
+
+import re
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+from scipy import sparse
+
+from metrics import REGISTRY
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+BATCH_MAX_CELLS = 4_000_000 # <-- Số ô tối đa của ma trận điểm (câu hỏi x chunk) mỗi lô, ~16 MB float32
+
+_SYLLABLE_RE = re.compile(r"\w+", re.UNICODE)
+
+
+@lru_cache(maxsize=65536)
+def fold_accents(syllable):
+    """Bỏ dấu tiếng Việt: "bộ" -> "bo", "đĩa" -> "dia"."""
+    syllable = syllable.replace("đ", "d").replace("Đ", "D")
+    decomposed = unicodedata.normalize("NFD", syllable)
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def vi_tokenize(text):
+    """
+    Tách văn bản tiếng Việt thành các "từ" để lập chỉ mục:
+    âm tiết có dấu + âm tiết bỏ dấu (nếu khác) + bigram âm tiết bỏ dấu ("bo_nho").
+    """
+    syllables = _SYLLABLE_RE.findall(unicodedata.normalize("NFC", text.lower()))
+    folded = [fold_accents(s) for s in syllables]
+    terms = list(syllables)
+    terms.extend(f for s, f in zip(syllables, folded) if f != s)
+    terms.extend(f"{a}_{b}" for a, b in zip(folded, folded[1:]))
+    return terms
+
+
+class BM25Index:
+    """
+    Chỉ mục ngược BM25 cho danh sách chunk.
+    - vocabulary: dict {từ: số cột}
+    - postings: ma trận CSC (số chunk x số từ); cột j = posting của từ j,
+      giá trị = điểm BM25 (đã nhân IDF) của từ j trong chunk đó
+    - max_impact: điểm lớn nhất của mỗi từ (cận trên dùng cho MaxScore)
+    """
+
+    def __init__(self, vocabulary, postings, max_impact, idf):
+        self.vocabulary = vocabulary
+        self.postings = postings
+        self.max_impact = max_impact
+        self.idf = idf
+
+    @property
+    def num_docs(self):
+        return self.postings.shape[0]
+
+    @classmethod
+    def build(cls, chunks, k1=BM25_K1, b=BM25_B):
+        """Lập chỉ mục BM25 cho list chunk (chuỗi)."""
+        vocabulary = {}
+        rows, cols, tfs = [], [], []
+        doc_lens = np.zeros(len(chunks), dtype=np.float32)
+        for doc_id, chunk in enumerate(chunks):
+            counts = Counter(vi_tokenize(chunk))
+            doc_lens[doc_id] = sum(counts.values())
+            for term, tf in counts.items():
+                rows.append(doc_id)
+                cols.append(vocabulary.setdefault(term, len(vocabulary)))
+                tfs.append(tf)
+
+        rows = np.asarray(rows, dtype=np.int32)
+        cols = np.asarray(cols, dtype=np.int32)
+        tfs = np.asarray(tfs, dtype=np.float32)
+        num_docs = len(chunks)
+
+        # IDF kiểu Lucene (luôn dương) và chuẩn hóa theo độ dài chunk
+        df = np.bincount(cols, minlength=len(vocabulary)).astype(np.float32)
+        idf = np.log1p((num_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avg_len = float(doc_lens.mean()) if num_docs else 0.0
+        norm = k1 * (1.0 - b + b * doc_lens[rows] / max(avg_len, 1e-9))
+        impacts = idf[cols] * tfs * (k1 + 1.0) / (tfs + norm)
+
+        postings = sparse.csc_matrix(
+            (impacts.astype(np.float32), (rows, cols)), shape=(num_docs, len(vocabulary))
+        )
+        postings.sort_indices()
+        max_impact = postings.max(axis=0).toarray().ravel().astype(np.float32)
+        return cls(vocabulary, postings, max_impact, idf)
+
+    def query_terms(self, query):
+        """Số cột (không trùng) của các từ trong câu hỏi có trong từ điển."""
+        ids = {self.vocabulary[t] for t in vi_tokenize(query) if t in self.vocabulary}
+        return np.fromiter(ids, dtype=np.int64, count=len(ids))
+
+    def _posting(self, term_id):
+        start, end = self.postings.indptr[term_id], self.postings.indptr[term_id + 1]
+        return self.postings.indices[start:end], self.postings.data[start:end]
+
+    def search(self, query, k=10):
+        """
+        Trả về (doc_ids, scores) của tối đa k chunk điểm cao nhất (giảm dần).
+        Dùng MaxScore: xét các từ theo max_impact giảm dần; khi tổng max_impact của
+        các từ còn lại <= điểm thứ k hiện tại thì không nhận ứng viên mới nữa.
+        """
+        with REGISTRY.timer("rag_query_tokenize_seconds", "Thời gian tách từ câu hỏi"):
+            term_ids = self.query_terms(query)
+        return self.search_terms(term_ids, k)
+
+    def search_terms(self, term_ids, k=10):
+        """Như search() nhưng nhận sẵn query_terms(query) (tách từ một lần, dùng cho nhiều bước)."""
+        if term_ids.size == 0 or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        with REGISTRY.timer("rag_query_score_seconds", "Thời gian chấm điểm BM25 + lấy top-k"):
+            return self._max_score_top_k(term_ids, k)
+
+    def _max_score_top_k(self, term_ids, k):
+        term_ids = term_ids[np.argsort(-self.max_impact[term_ids], kind="stable")]
+        # remaining[i] = tổng điểm tối đa mà các từ i, i+1, ... còn có thể cộng thêm
+        remaining = np.cumsum(self.max_impact[term_ids][::-1])[::-1]
+
+        cand_ids = np.empty(0, dtype=np.int32)
+        cand_scores = np.empty(0, dtype=np.float32)
+        for i, term_id in enumerate(term_ids):
+            doc_ids, impacts = self._posting(term_id)
+            threshold = self._kth_score(cand_scores, k)
+            if remaining[i] > threshold:
+                # Từ "thiết yếu": chunk chưa có trong ứng viên vẫn có thể lọt top-k -> gộp cả posting
+                merged_ids = np.concatenate((cand_ids, doc_ids))
+                merged_scores = np.concatenate((cand_scores, impacts))
+                cand_ids, inverse = np.unique(merged_ids, return_inverse=True)
+                cand_scores = np.bincount(inverse, weights=merged_scores).astype(np.float32)
+            else:
+                # Từ "không thiết yếu": bỏ ứng viên chắc chắn không vào top-k, chỉ chấm phần còn lại
+                keep = cand_scores + remaining[i] > threshold
+                cand_ids, cand_scores = cand_ids[keep], cand_scores[keep]
+                pos = np.minimum(np.searchsorted(doc_ids, cand_ids), len(doc_ids) - 1)
+                hit = doc_ids[pos] == cand_ids
+                cand_scores[hit] += impacts[pos[hit]]
+
+        return self._top_k(cand_ids, cand_scores, k)
+
+    def search_batch(self, queries, k=10):
+        """
+        Tìm kiếm nhiều câu hỏi cùng lúc. Trả về list (doc_ids, scores) song song với queries,
+        mỗi phần tử giống kết quả của search() (hòa điểm ở vị trí thứ k có thể chọn chunk khác).
+        Câu hỏi được chia lô để ma trận điểm dày không vượt BATCH_MAX_CELLS ô.
+        """
+        with REGISTRY.timer("rag_batch_search_seconds", "Thời gian tìm kiếm theo lô"):
+            term_lists = [self.query_terms(q) for q in queries]
+            doc_terms = self.postings.T # CSR (từ x chunk), không sao chép
+            k = min(k, self.num_docs)
+            block_size = max(1, BATCH_MAX_CELLS // max(self.num_docs, 1))
+            results = []
+            for start in range(0, len(term_lists), block_size):
+                block = term_lists[start:start + block_size]
+                if k <= 0:
+                    results.extend((np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in block)
+                    continue
+                indptr = np.zeros(len(block) + 1, dtype=np.int64)
+                np.cumsum([len(t) for t in block], out=indptr[1:])
+                query_matrix = sparse.csr_matrix(
+                    (np.ones(indptr[-1], dtype=np.float32), np.concatenate(block), indptr),
+                    shape=(len(block), len(self.vocabulary))
+                )
+                scores = (query_matrix @ doc_terms).toarray() # (câu hỏi x chunk)
+
+                # Top-k từng dòng: argpartition rồi sắp xếp k phần tử (điểm giảm dần, hòa thì id nhỏ trước)
+                if k < scores.shape[1]:
+                    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                else:
+                    top = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+                top_scores = np.take_along_axis(scores, top, axis=1)
+                order = np.lexsort((top, -top_scores), axis=-1)
+                top = np.take_along_axis(top, order, axis=1)
+                top_scores = np.take_along_axis(top_scores, order, axis=1)
+                for ids, row_scores in zip(top, top_scores):
+                    keep = row_scores > 0 # Chunk không chứa từ nào của câu hỏi thì không tính
+                    results.append((ids[keep].astype(np.int64), row_scores[keep]))
+            return results
+
+    def max_possible_score(self, query):
+        """Cận trên điểm BM25 của câu hỏi (dùng để chuẩn hóa điểm về khoảng 0..1)."""
+        return self.max_score_of_terms(self.query_terms(query))
+
+    def max_score_of_terms(self, term_ids):
+        return float(self.max_impact[term_ids].sum()) if term_ids.size else 0.0
+
+    @staticmethod
+    def _kth_score(scores, k):
+        if len(scores) < k:
+            return 0.0
+        return float(np.partition(scores, len(scores) - k)[len(scores) - k])
+
+    @staticmethod
+    def _top_k(doc_ids, scores, k):
+        if len(scores) > k:
+            part = np.argpartition(scores, len(scores) - k)[len(scores) - k:]
+            doc_ids, scores = doc_ids[part], scores[part]
+        order = np.lexsort((doc_ids, -scores)) # Điểm giảm dần, hòa điểm thì chunk trước đứng trước
+        return doc_ids[order].astype(np.int64), scores[order]
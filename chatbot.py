@@ -1,18 +1,22 @@
 # Chạy bằng lệnh: streamlit run chatbot.py
 # ‼️ Yêu cầu cài đặt: 
-# pip install groq streamlit pypdf langchain langchain-text-splitters scikit-learn numpy
-# (Lưu ý: Các thư viện pypdf, langchain, scikit-learn là BẮT BUỘC để RAG hoạt động)
+# pip install groq streamlit pypdf langchain langchain-text-splitters scipy numpy
+# (Lưu ý: Các thư viện pypdf, langchain, scipy là BẮT BUỘC để RAG hoạt động)
 
 import streamlit as st
-from groq import Groq
+from llm_gateway import LLMGateway, LLMBusyError # <-- ĐÃ SỬA: Một client Groq dùng chung (pool kết nối, hàng đợi, thử lại)
 import os
-import glob
 import time
-from pypdf import PdfReader # <-- ĐÃ THÊM: Thư viện đọc PDF
-from langchain_text_splitters import RecursiveCharacterTextSplitter # <-- ĐÃ SỬA: Import từ gói riêng
-from sklearn.feature_extraction.text import TfidfVectorizer # <-- ĐÃ THÊM: Vector hóa
-from sklearn.metrics.pairwise import cosine_similarity # <-- ĐÃ THÊM: Tính tương đồng
-import numpy as np # <-- ĐÃ THÊM: Hỗ trợ tính toán
+import uuid
+from metrics import REGISTRY as METRICS, start_http_server # <-- ĐÃ THÊM: Đo thời gian từng bước
+from conversation_memory import ConversationArchive, cleanup_old_archives, fold_old_messages # <-- ĐÃ THÊM: Gấp lịch sử cũ
+from context_packer import pack_context # <-- ĐÃ THÊM: Ghép prompt theo ngân sách token
+from stream_render import StreamRenderer # <-- ĐÃ THÊM: Vẽ câu trả lời stream theo khung hình
+from response_cache import ResponseCache, make_cache_key, replay_stream # <-- ĐÃ THÊM: Cache câu trả lời lặp lại
+from faq_store import FaqStore, append_entry, FAQ_ANSWER_THRESHOLD, FAQ_CONTEXT_THRESHOLD # <-- ĐÃ THÊM: Trả lời nhanh từ kienthuc.txt
+from chunk_select import select_chunks # <-- ĐÃ THÊM: MMR + gộp chunk liền nhau
+from chunk_store import format_citation, format_citations # <-- ĐÃ THÊM: Trích dẫn nguồn (file PDF, trang)
+from rag_index import list_pdf_files, RagIndexHolder # <-- ĐÃ THÊM: Chỉ mục BM25 lưu trên đĩa, tự cập nhật ở luồng nền
 
 # --- BƯỚC 1: LẤY API KEY ---
 try:
@@ -83,14 +87,74 @@ Khi học sinh hỏi về mục lục sách (ví dụ: Tin 12 KNTT), bạn PHẢ
 """
 
 # --- BƯỚC 3: KHỞI TẠO CLIENT VÀ CHỌN MÔ HÌNH ---
+@st.cache_resource
+def get_llm_gateway(api_key):
+    """Tạo MỘT LẦN cho cả tiến trình, mọi phiên chat dùng chung (xem llm_gateway.py)."""
+    return LLMGateway(api_key=api_key)
+
 try:
-    client = Groq(api_key=api_key) 
+    llm_gateway = get_llm_gateway(api_key)
 except Exception as e:
     st.error(f"Lỗi khi cấu hình API Groq: {e}")
     st.stop()
 
 MODEL_NAME = 'llama-3.1-8b-instant'
 PDF_DIR = "./PDF_KNOWLEDGE" # <-- ĐÃ THÊM: ĐƯỜNG DẪN ĐẾN THƯ MỤC CHỨA CÁC FILE PDF "SỔ TAY"
+RAG_INDEX_DIR = "./.rag_cache" # <-- ĐÃ THÊM: Nơi lưu chỉ mục RAG để khởi động lại không phải đọc PDF
+RAG_MIN_RELATIVE_SCORE = 0.1 # <-- Ngưỡng lọc nhiễu BM25 (tỉ lệ so với điểm tối đa của câu hỏi)
+RAG_NUM_CHUNKS = 3 # <-- Số chunk tối đa gửi cho AI mỗi câu hỏi
+# <-- "lexical" = chỉ BM25; "hybrid" = BM25 + LSA (bắt thêm câu hỏi diễn đạt khác sách, xem dense_index.py).
+# Mặc định "lexical": trên benchmarks/retrieval_queries_v1.jsonl, hybrid làm tỉ lệ có đoạn đúng sau MMR
+# giảm 0.91 -> 0.88; chỉ bộ câu hỏi diễn đạt lại (25 câu, cũng là bộ đã dùng để chỉnh tham số) tăng 0.52 -> 0.60
+RAG_RETRIEVAL_MODE = "lexical"
+SUGGESTION_PROMPTS = [ # <-- Câu hỏi của các nút gợi ý (được tính trước kết quả tìm kiếm khi dựng chỉ mục)
+    "Giải thích về 'biến' trong lập trình?",
+    "Trình bày về an toàn thông tin?",
+    "Sự khác nhau giữa RAM và ROM?",
+    "Các bước chèn ảnh vào word?",
+]
+RAG_MMR_LAMBDA = 0.7 # <-- 1.0 = chỉ xét độ liên quan; nhỏ hơn = ưu tiên chunk ít trùng lặp (xem chunk_select.py)
+MAX_RENDERED_MESSAGES = 12 # <-- Số tin nhắn gần nhất giữ đầy đủ; cũ hơn thì gấp vào bản tóm tắt
+CONTEXT_TOKEN_BUDGET = 4000 # <-- Ngân sách token (ước lượng) cho phần prompt gửi đi, chưa tính câu trả lời
+FAQ_PATH = "./kienthuc.txt" # <-- ĐÃ THÊM: Các mục "Chủ đề: … / Nội dung: …" do giáo viên soạn
+RESPONSE_CACHE_PATH = os.path.join(RAG_INDEX_DIR, "responses.sqlite3") # <-- Đặt None để chỉ cache trong RAM
+METRICS_PORT = 9108 # <-- Số liệu Prometheus tại http://127.0.0.1:9108/metrics (None để tắt)
+METRICS_JSONL_PATH = os.path.join(RAG_INDEX_DIR, "metrics.jsonl") # <-- Mỗi lượt hỏi một dòng JSON (None để tắt)
+ADMIN_KEY = st.secrets.get("ADMIN_KEY") # <-- Mở bảng số liệu admin bằng URL ...?admin=<ADMIN_KEY>
+
+# --- BƯỚC 3.4: XUẤT SỐ LIỆU (CHẠY MỘT LẦN CHO CẢ TIẾN TRÌNH) ---
+@st.cache_resource
+def start_metrics_exporters():
+    """Bật file JSONL và endpoint Prometheus cho METRICS (xem metrics.py)."""
+    if METRICS_JSONL_PATH:
+        os.makedirs(os.path.dirname(METRICS_JSONL_PATH), exist_ok=True)
+        METRICS.set_jsonl_sink(METRICS_JSONL_PATH)
+    if METRICS_PORT:
+        try:
+            return start_http_server(METRICS_PORT)
+        except OSError as e: # Cổng đã bị tiến trình khác dùng
+            print(f"Không mở được endpoint số liệu ở cổng {METRICS_PORT}: {e}")
+    return None
+
+start_metrics_exporters()
+
+# --- BƯỚC 3.45: KHO FAQ (DÙNG CHUNG MỌI PHIÊN) ---
+@st.cache_resource
+def get_faq_store():
+    """Đọc kienthuc.txt một lần; file bị sửa thì tự đọc lại (xem faq_store.py)."""
+    return FaqStore(FAQ_PATH)
+
+faq_store = get_faq_store()
+
+# --- BƯỚC 3.5: CACHE CÂU TRẢ LỜI (DÙNG CHUNG MỌI PHIÊN) ---
+@st.cache_resource
+def get_response_cache():
+    """Một ResponseCache cho cả tiến trình (xem response_cache.py): LRU 512 câu, hết hạn sau 1 ngày."""
+    if RESPONSE_CACHE_PATH:
+        os.makedirs(os.path.dirname(RESPONSE_CACHE_PATH), exist_ok=True)
+    return ResponseCache(max_entries=512, ttl=24 * 3600, disk_path=RESPONSE_CACHE_PATH)
+
+response_cache = get_response_cache()
 
 # --- BƯỚC 4: CẤU HÌNH TRANG VÀ CSS ---
 st.set_page_config(page_title="Chatbot Tin học 2018", page_icon="✨", layout="centered")
@@ -116,9 +180,10 @@ with st.sidebar:
     
     if st.button("➕ Cuộc trò chuyện mới", use_container_width=True):
         st.session_state.messages = []
-        # Xóa cache RAG để tải lại nếu cần
-        st.session_state.pop("rag_system", None) 
-        st.cache_resource.clear() # Xóa cache resource
+        st.session_state.conversation_summary = ""
+        if "conversation_archive" in st.session_state:
+            st.session_state.conversation_archive.clear()
+        # KHÔNG xóa chỉ mục RAG: chỉ mục dùng chung được luồng nền tự cập nhật (xem BƯỚC 4.6)
         st.rerun()
 
     st.markdown("---")
@@ -131,147 +196,178 @@ with st.sidebar:
     )
     st.markdown("---")
     st.caption(f"Model: {MODEL_NAME}")
+    cache_stats = response_cache.stats()
+    st.caption(f"Cache câu trả lời: {cache_stats['hits']} trúng / {cache_stats['misses']} trượt")
+
+    # Bảng số liệu cho admin: p95 từng bước và các bộ đếm
+    if ADMIN_KEY and st.query_params.get("admin") == ADMIN_KEY:
+        with st.expander("📊 Số liệu hệ thống (admin)"):
+            llm_stats = llm_gateway.stats()
+            st.caption(f"Groq: {llm_stats['in_flight']}/{llm_stats['max_concurrent']} đang chạy, {llm_stats['waiting']} đang chờ")
+            for name, value in METRICS.snapshot().items():
+                if isinstance(value, dict):
+                    p95 = "–" if value["p95"] is None else f"{value['p95'] * 1000:.1f} ms"
+                    st.caption(f"`{name}`: p95 {p95} (n={value['count']})")
+                else:
+                    st.caption(f"`{name}`: {value:g}")
+
+        # Thêm mục FAQ mới vào kienthuc.txt; FaqStore tự đọc lại nên mọi phiên dùng được ngay
+        with st.expander("📝 Thêm mục FAQ (admin)"):
+            with st.form("faq_add_form", clear_on_submit=True):
+                faq_topics = st.text_input("Chủ đề (các cách gọi, ngăn bởi dấu phẩy)")
+                faq_content = st.text_area("Nội dung")
+                if st.form_submit_button("Lưu mục FAQ"):
+                    topics = [t.strip() for t in faq_topics.split(",") if t.strip()]
+                    if not topics or not faq_content.strip():
+                        st.warning("Cần nhập cả chủ đề và nội dung.")
+                    else:
+                        try:
+                            append_entry(FAQ_PATH, topics, faq_content)
+                        except OSError as e: # vd. máy chủ chỉ-đọc
+                            st.error(f"Không ghi được {FAQ_PATH}: {e}")
+                        else:
+                            faq_store.reload_if_changed()
+                            METRICS.event("faq_entry_added", topics=topics)
+                            st.success(f"Đã thêm mục FAQ ({len(faq_store.entries)} mục).")
 
 
 # --- BƯỚC 4.6: CÁC HÀM RAG (ĐỌC "SỔ TAY" TỪ PDF) --- #
 # <-- ĐÃ SỬA: Cập nhật các hàm RAG để hoạt động
 
-@st.cache_resource(ttl=3600) # Dùng cache_resource cho các đối tượng (như vectorizer)
-def initialize_rag_system(pdf_directory=PDF_DIR):
+@st.cache_resource # Một holder duy nhất cho cả tiến trình, dùng chung mọi phiên chat
+def get_rag_holder(pdf_directory=PDF_DIR):
     """
-    Hàm này sẽ quét thư mục PDF, đọc, chia nhỏ và tạo chỉ mục TF-IDF.
-    Nó được cache lại để chỉ chạy một lần mỗi giờ hoặc khi cache bị xóa.
-    Trả về: (vectorizer, tfidf_matrix, all_chunks) hoặc (None, None, None) nếu lỗi.
+    Tạo RagIndexHolder (xem rag_index.py) và khởi động luồng nền của nó.
+    Luồng nền tải chỉ mục đã lưu trên đĩa (hoặc dựng mới nếu PDF đổi), kiểm tra thư mục PDF
+    mỗi 30 giây và dựng lại mỗi giờ, rồi thay chỉ mục mới vào mà không chặn phiên nào.
+    Mỗi lần dựng, bối cảnh RAG của các nút gợi ý được tính sẵn (prepare_suggestions),
+    nên bấm nút gợi ý bỏ qua hẳn bước tìm kiếm + chọn chunk.
     """
     print("--- BẮT ĐẦU KHỞI TẠO HỆ THỐNG RAG (CHẠY LẦN ĐẦU) ---")
-    
-    # 1. Tải và chia nhỏ PDF
-    all_chunks = []
-    try:
-        pdf_files = glob.glob(os.path.join(pdf_directory, "*.pdf"))
-        
-        if not pdf_files:
-            print(f"!!! CẢNH BÁO RAG: Không tìm thấy file PDF nào trong thư mục '{pdf_directory}'.")
-            st.warning(f"Tính năng RAG (đọc sổ tay) đã bật, nhưng không tìm thấy file PDF nào trong thư mục `{pdf_directory}`. Vui lòng tạo thư mục và thêm PDF vào.", icon="⚠️")
-            return None, None, None # Trả về None
-
-        print(f"Tìm thấy {len(pdf_files)} file PDF. Đang xử lý...")
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1200, 
-            chunk_overlap=150,
-            length_function=len
-        )
-        
-        for pdf_path in pdf_files:
-            try:
-                reader = PdfReader(pdf_path)
-                raw_text = "".join(page.extract_text() or "" for page in reader.pages)
-                if raw_text:
-                    chunks = text_splitter.split_text(raw_text)
-                    all_chunks.extend(chunks)
-                    print(f"Đã xử lý: {os.path.basename(pdf_path)} ({len(chunks)} chunks)")
-            except Exception as e:
-                print(f"Lỗi khi đọc file {pdf_path}: {e}")
-                st.error(f"Lỗi đọc file PDF: {os.path.basename(pdf_path)}")
-
-        if not all_chunks:
-            print("!!! CẢNH BÁO RAG: Đã đọc file PDF nhưng không trích xuất được nội dung.")
-            st.warning("Đã tìm thấy file PDF nhưng không thể trích xuất nội dung. RAG sẽ không hoạt động.", icon="⚠️")
-            return None, None, None
-        
-        print(f"Tổng cộng {len(all_chunks)} khối kiến thức. Đang tạo chỉ mục TF-IDF...")
-        
-        # 2. Vector hóa (TF-IDF)
-        vectorizer = TfidfVectorizer()
-        tfidf_matrix = vectorizer.fit_transform(all_chunks)
-        print("--- HOÀN TẤT KHỞI TẠO RAG ---")
-        
-        # Trả về cả 3: vectorizer, ma trận tfidf, và list các chunk
-        return vectorizer, tfidf_matrix, all_chunks
-        
-    except Exception as e:
-        print(f"Lỗi nghiêm trọng khi khởi tạo RAG: {e}")
-        st.error(f"Lỗi khởi tạo RAG: {e}")
-        return None, None, None
+    return RagIndexHolder(
+        pdf_directory, RAG_INDEX_DIR, refresh_interval=3600, poll_interval=30,
+        prefetch_queries=SUGGESTION_PROMPTS, prefetch_k=RAG_NUM_CHUNKS * 4,
+        prefetch_hybrid_min_relative_score=RAG_MIN_RELATIVE_SCORE if RAG_RETRIEVAL_MODE == "hybrid" else None,
+        prepare=prepare_suggestions, build_dense=RAG_RETRIEVAL_MODE == "hybrid" # Chỉ dựng LSA khi cần
+    ).start()
+
+def prepare_suggestions(rag_index):
+    """Tính sẵn kết quả cuối cùng (đoạn kèm nguồn, id chunk) của các câu hỏi gợi ý cho chỉ mục mới."""
+    rag_index.precomputed = {
+        query: retrieve_knowledge(query, rag_index) for query in SUGGESTION_PROMPTS
+    }
 
-def find_relevant_knowledge(query, vectorizer, tfidf_matrix, all_chunks, num_chunks=3):
+def retrieve_knowledge(query, rag_index, num_chunks=RAG_NUM_CHUNKS):
     """
-    Tìm kiếm các chunk liên quan nhất bằng TF-IDF và cosine similarity.
+    Tìm kiếm các chunk liên quan nhất bằng BM25 trên chỉ mục ngược (xem bm25_search.py), kết hợp
+    với chỉ mục LSA nếu RAG_RETRIEVAL_MODE = "hybrid" (xem dense_index.py), rồi chọn lọc bằng MMR:
+    gộp chunk liền nhau thành đoạn và bỏ bớt đoạn trùng lặp (xem chunk_select.py).
+    Trả về: (list nội dung đoạn kèm dòng nguồn, list id chunk), liên quan nhất trước; ([], []) nếu không tìm thấy.
     """
-    if vectorizer is None or tfidf_matrix is None or not all_chunks:
-        return None # RAG không được khởi tạo
-        
-    print(f"--- RAG ĐANG TÌM KIẾM CHO QUERY: '{query[:50]}...' ---")
-    try:
-        # 1. Vector hóa câu query
-        query_vector = vectorizer.transform([query])
-        
-        # 2. Tính toán độ tương đồng cosine
-        cosine_similarities = cosine_similarity(query_vector, tfidf_matrix).flatten()
-        
-        # 3. Lọc ra N chunk có điểm cao nhất và > 0
-        # Lấy ra index của N*2 chunk cao nhất (để dự phòng)
-        k = min(num_chunks * 2, len(cosine_similarities)) 
-        if k <= 0: return None # Không có chunk nào
-
-        # Lấy index của các chunk có điểm cao nhất (chưa sắp xếp)
-        relevant_indices_partitioned = np.argpartition(cosine_similarities, -k)[-k:]
-        
-        # Lọc ra những chunk có điểm > 0.05 (ngưỡng lọc nhiễu)
-        top_scores_indices = [
-            i for i in relevant_indices_partitioned 
-            if cosine_similarities[i] > 0.05 
+    if RAG_RETRIEVAL_MODE == "hybrid" and rag_index.dense is not None: # <-- ĐÃ THÊM
+        # 1-2. N*4 ứng viên gộp từ BM25 (đạt ngưỡng RAG_MIN_RELATIVE_SCORE) và LSA (đủ gần về nghĩa),
+        # nên chunk diễn đạt khác câu hỏi (vd. "bộ nhớ tạm" / "RAM") không bị ngưỡng BM25 loại mất
+        doc_ids, scores = rag_index.hybrid_search(query, k=num_chunks * 4, min_relative_score=RAG_MIN_RELATIVE_SCORE)
+        candidates = list(zip(doc_ids, scores))
+    else:
+        # 1. Lấy N*4 chunk điểm BM25 cao nhất làm ứng viên, đã sắp xếp giảm dần
+        doc_ids, scores = rag_index.search(query, k=num_chunks * 4)
+
+        # 2. Lọc nhiễu: điểm phải đạt tối thiểu RAG_MIN_RELATIVE_SCORE so với điểm tối đa có thể của câu hỏi
+        max_score = rag_index.max_possible_score(query)
+        candidates = [
+            (i, score) for i, score in zip(doc_ids, scores)
+            if max_score > 0 and score / max_score >= RAG_MIN_RELATIVE_SCORE
         ]
-        
-        # Sắp xếp lại theo điểm số thực (từ cao đến thấp)
-        top_scores_indices.sort(key=lambda i: cosine_similarities[i], reverse=True)
-        
-        # Lấy top N (num_chunks)
-        final_indices = top_scores_indices[:num_chunks]
-        
-        if not final_indices:
-            print("RAG không tìm thấy chunk nào đủ liên quan.")
-            return None
-            
-        # 4. Trả về nội dung các chunk
-        relevant_chunks = [all_chunks[i] for i in final_indices]
-        print(f"RAG tìm thấy {len(relevant_chunks)} chunk liên quan.")
-        return "\n---\n".join(relevant_chunks)
-        
+
+    if not candidates:
+        return [], []
+
+    # 3. MMR: tối đa num_chunks chunk, chunk liền nhau được gộp và bỏ phần chồng lấn
+    spans = select_chunks(
+        rag_index, [i for i, _ in candidates], [s for _, s in candidates],
+        num_chunks=num_chunks, mmr_lambda=RAG_MMR_LAMBDA
+    )
+
+    # 4. Trả về nội dung các đoạn, mỗi đoạn mở đầu bằng nguồn (file PDF, trang) để AI trích dẫn
+    relevant_chunks = [f"(Nguồn: {format_citation(*span.source)})\n{span.text}" for span in spans]
+    return relevant_chunks, [i for span in spans for i in span.ids]
+
+def find_relevant_knowledge(query, rag_index, num_chunks=RAG_NUM_CHUNKS):
+    """
+    Như retrieve_knowledge, nhưng dùng kết quả tính sẵn nếu có (câu hỏi gợi ý) và đếm số liệu.
+    Trả về bản sao (người gọi được phép sửa list, vd. chèn FAQ vào đầu).
+    """
+    if rag_index is None or not rag_index.all_chunks:
+        return [], [] # RAG không được khởi tạo
+
+    try:
+        precomputed = rag_index.precomputed.get(query) if num_chunks == RAG_NUM_CHUNKS else None
+        if precomputed is not None:
+            METRICS.counter("rag_precomputed_hits_total", "Số câu hỏi gợi ý dùng bối cảnh RAG tính sẵn").inc()
+            relevant_chunks, ids = precomputed
+        else:
+            relevant_chunks, ids = retrieve_knowledge(query, rag_index, num_chunks)
     except Exception as e:
         print(f"Lỗi khi tìm kiếm RAG: {e}")
-        return None
+        return [], []
+
+    if not relevant_chunks:
+        METRICS.counter("rag_misses_total", "Số câu hỏi RAG không tìm thấy chunk đủ liên quan").inc()
+        return [], []
+    METRICS.counter("rag_hits_total", "Số câu hỏi RAG tìm thấy chunk liên quan").inc()
+    return list(relevant_chunks), list(ids)
 
 
 # --- BƯỚC 5: KHỞI TẠO LỊCH SỬ CHAT VÀ "SỔ TAY" PDF --- #
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "conversation_archive" not in st.session_state:
+    # Bản tóm tắt + file lưu các tin nhắn đã gấp của phiên này (xem conversation_memory.py)
+    cleanup_old_archives()
+    st.session_state.conversation_summary = ""
+    st.session_state.conversation_archive = ConversationArchive(uuid.uuid4().hex)
 
 # --- ĐÃ KÍCH HOẠT RAG (ĐỌC "SỔ TAY" PDF) --- # <-- ĐÃ SỬA
-# Tải và xử lý PDF khi app khởi động (hoặc khi cache bị xóa)
-if "rag_system" not in st.session_state:
+# Chỉ mục RAG dùng chung được giữ trong rag_holder. Chỉ lần đầu tiên của tiến trình
+# (chưa có chỉ mục nào) mới phải chờ; các lần dựng lại sau đó chạy ở luồng nền.
+rag_holder = get_rag_holder(PDF_DIR)
+if not rag_holder.wait_ready(timeout=0):
     with st.spinner("Đang khởi tạo và lập chỉ mục 'sổ tay' PDF (RAG)..."):
-        # Hàm này trả về (vectorizer, tfidf_matrix, all_chunks)
-        rag_components = initialize_rag_system(PDF_DIR)
-        # Lưu cả 3 vào một biến session state
-        st.session_state.rag_system = rag_components
-        
-# Lấy ra các thành phần RAG từ session state (dù mới khởi tạo hay đã có)
-# Thêm kiểm tra phòng trường hợp rag_components là (None, None, None)
-if "rag_system" in st.session_state and st.session_state.rag_system:
-    vectorizer, tfidf_matrix, all_chunks = st.session_state.rag_system
-    if all_chunks:
-        print(f"Đã tải {len(all_chunks)} khối kiến thức vào cache.")
-    else:
-        print("Hệ thống RAG đã khởi tạo nhưng không có kiến thức (PDF).")
+        rag_holder.wait_ready()
+
+# Lấy "ảnh chụp" chỉ mục hiện hành cho cả lượt chạy này (không đổi giữa chừng dù có bản mới)
+rag_index = rag_holder.get()
+# (Số chunk / phiên bản chỉ mục được ghi một lần mỗi lần thay chỉ mục: sự kiện "rag_index_swap")
+if rag_index is not None:
+    # Báo file PDF lỗi một lần cho mỗi phiên bản chỉ mục
+    if rag_index.failed_files and st.session_state.get("rag_warned_version") != rag_holder.version:
+        st.session_state.rag_warned_version = rag_holder.version
+        for name in rag_index.failed_files:
+            st.error(f"Lỗi đọc file PDF: {name}")
 else:
     # Xử lý trường hợp không có PDF hoặc RAG lỗi
-    vectorizer, tfidf_matrix, all_chunks = None, None, None
-    print("RAG không hoạt động (không có file PDF hoặc lỗi khởi tạo).")
+    if not st.session_state.get("rag_warned_missing"):
+        st.session_state.rag_warned_missing = True
+        if rag_holder.last_error is not None:
+            st.error(f"Lỗi khởi tạo RAG: {rag_holder.last_error}")
+        elif not list_pdf_files(PDF_DIR):
+            st.warning(f"Tính năng RAG (đọc sổ tay) đã bật, nhưng không tìm thấy file PDF nào trong thư mục `{PDF_DIR}`. Vui lòng tạo thư mục và thêm PDF vào.", icon="⚠️")
+        else:
+            st.warning("Đã tìm thấy file PDF nhưng không thể trích xuất nội dung. RAG sẽ không hoạt động.", icon="⚠️")
 # --- KẾT THÚC KÍCH HOẠT RAG ---
 
 
 # --- BƯỚC 6: HIỂN THỊ LỊCH SỬ CHAT ---
+# Chỉ vẽ MAX_RENDERED_MESSAGES tin nhắn gần nhất; tin nhắn cũ chỉ đọc từ file khi bật xem
+conversation_archive = st.session_state.conversation_archive
+if conversation_archive.count and st.toggle(
+    f"Xem {conversation_archive.count} tin nhắn cũ hơn", key="show_archived_messages"
+):
+    for message in conversation_archive.load():
+        avatar = "✨" if message["role"] == "assistant" else "👤"
+        with st.chat_message(message["role"], avatar=avatar):
+            st.markdown(message["content"])
 for message in st.session_state.messages:
     avatar = "✨" if message["role"] == "assistant" else "👤"
     with st.chat_message(message["role"], avatar=avatar):
@@ -300,23 +396,23 @@ if not st.session_state.messages:
     with col1_btn:
         st.button(
             "Giải thích về 'biến' trong lập trình?",
-            on_click=set_prompt_from_suggestion, args=("Giải thích về 'biến' trong lập trình?",),
+            on_click=set_prompt_from_suggestion, args=(SUGGESTION_PROMPTS[0],),
             use_container_width=True
         )
         st.button(
             "Trình bày về an toàn thông tin?",
-            on_click=set_prompt_from_suggestion, args=("Trình bày về an toàn thông tin?",),
+            on_click=set_prompt_from_suggestion, args=(SUGGESTION_PROMPTS[1],),
             use_container_width=True
         )
     with col2_btn:
         st.button(
             "Sự khác nhau giữa RAM và ROM?",
-            on_click=set_prompt_from_suggestion, args=("Sự khác nhau giữa RAM và ROM?",),
+            on_click=set_prompt_from_suggestion, args=(SUGGESTION_PROMPTS[2],),
             use_container_width=True
         )
         st.button(
             "Các bước chèn ảnh vào word",
-            on_click=set_prompt_from_suggestion, args=("Các bước chèn ảnh vào word?",),
+            on_click=set_prompt_from_suggestion, args=(SUGGESTION_PROMPTS[3],),
             use_container_width=True
         )
 
@@ -340,74 +436,114 @@ if prompt:
 
             # --- ĐÃ KÍCH HOẠT LẠI LOGIC RAG --- # <-- ĐÃ SỬA
 
-            # 2.1. Lấy các thành phần RAG (đã được tải ở BƯỚC 5)
-            # (biến vectorizer, tfidf_matrix, all_chunks đã tồn tại ở global scope của script)
+            # 2.1. Tra FAQ trước: khớp gần như chính xác thì trả lời ngay, không cần RAG và Groq
+            with METRICS.timer("faq_match_seconds", "Thời gian tra FAQ"):
+                faq_store.reload_if_changed()
+                faq_match = faq_store.match(prompt)
+            # Trả lời thẳng chỉ khi khớp ĐÚNG (không nhờ chấp nhận gõ sai)
+            faq_direct = faq_match is not None and faq_match.score >= FAQ_ANSWER_THRESHOLD and not faq_match.fuzzy
             
             # 2.2. Tìm kiếm trong kho kiến thức PDF
-            retrieved_context = None
-            if all_chunks: # Chỉ tìm nếu có kiến thức (tức là all_chunks không rỗng)
-                retrieved_context = find_relevant_knowledge(
-                    prompt, vectorizer, tfidf_matrix, all_chunks, num_chunks=3
+            # (biến rag_index đã tồn tại ở global scope của script, có thể là None)
+            retrieved_chunks, retrieved_ids, faq_ids = [], [], []
+            if rag_index is not None and not faq_direct: # Chỉ tìm nếu có kiến thức
+                with METRICS.timer("rag_retrieval_seconds", "Thời gian tìm kiếm RAG (tách từ + chấm điểm + lọc)"):
+                    retrieved_chunks, retrieved_ids = find_relevant_knowledge(prompt, rag_index)
+            if faq_match is not None and not faq_direct and faq_match.score >= FAQ_CONTEXT_THRESHOLD:
+                # FAQ khớp khá: đặt lên ĐẦU bối cảnh (ưu tiên hơn chunk PDF khi ghép theo ngân sách)
+                retrieved_chunks.insert(0, faq_match.entry.as_context())
+                faq_ids.append(faq_match.entry.entry_id)
+
+            # 2.3 + 2.4. Ghép prompt theo ngân sách token (xem context_packer.py):
+            # system prompt -> câu hỏi -> chunk RAG điểm cao -> các lượt chat gần nhất
+            with METRICS.timer("prompt_assembly_seconds", "Thời gian ghép prompt"):
+                messages_to_send, token_breakdown = pack_context(
+                    SYSTEM_INSTRUCTION,
+                    prompt,
+                    history=st.session_state.messages[:-1], # Bỏ câu hỏi hiện tại (đã nằm ở cuối)
+                    chunks=retrieved_chunks,
+                    budget=CONTEXT_TOKEN_BUDGET,
+                    summary=st.session_state.conversation_summary
                 )
 
-            # 2.3. Chuẩn bị list tin nhắn gửi cho AI
-            messages_to_send = [
-                {"role": "system", "content": SYSTEM_INSTRUCTION}
-            ]
-
-            # 2.4. Xây dựng prompt dựa trên việc có tìm thấy RAG hay không
-            if retrieved_context:
-                print("--- RAG ĐÃ TÌM THẤY KIẾN THỨC ---")
-                
-                # Tạo một "bản sao" của lịch sử chat để chèn RAG
-                # Chỉ lấy N tin nhắn cuối để tiết kiệm token (ví dụ 6 tin nhắn)
-                temp_messages = list(st.session_state.messages[:-1])[-6:]
-                
-                # Lấy câu hỏi cuối cùng của user (là "prompt" hiện tại)
-                last_user_message_content = st.session_state.messages[-1]['content']
-                
-                # Tạo prompt RAG
-                rag_prompt = f"""
----
-BỐI CẢNH TRA CỨU TỪ SỔ TAY (RAG):
-{retrieved_context}
----
-DỰA VÀO BỐI CẢNH TRÊN (nếu liên quan), hãy trả lời câu hỏi sau đây một cách sư phạm và chi tiết:
-Câu hỏi: "{last_user_message_content}"
-"""
-                # Thêm lại các tin nhắn cũ
-                messages_to_send.extend(temp_messages)
-                # Thêm prompt RAG mới
-                messages_to_send.append({"role": "user", "content": rag_prompt})
-                
-                print("Đã gửi prompt RAG cho AI.")
-
-            else:
-                # RAG không tìm thấy gì, hoặc RAG bị tắt
-                print("RAG không tìm thấy gì. Trả lời bình thường.")
-                # Gửi toàn bộ lịch sử chat (hoặc N tin nhắn cuối)
-                messages_to_send.extend(st.session_state.messages[-10:]) # Gửi 10 tin nhắn cuối
-
             # --- KẾT THÚC LOGIC RAG --- #
 
-            # 2.5. Gọi API Groq
-            stream = client.chat.completions.create(
-                messages=messages_to_send, # Gửi list tin nhắn đã xử lý RAG
-                model=MODEL_NAME,
-                stream=True,
-                max_tokens=4096 # Tăng giới hạn token
-            )
-            
-            # 2.6. Lặp qua từng "mẩu" (chunk) API trả về
-            for chunk in stream:
-                if chunk.choices[0].delta.content is not None: 
-                    bot_response_text += chunk.choices[0].delta.content
-                    placeholder.markdown(bot_response_text + "▌")
-                    time.sleep(0.005) # <--- Tạo hiệu ứng
+            # 2.5. Tra cache trước; chỉ gọi API Groq khi chưa có câu trả lời cho câu hỏi này
+            request_started = time.perf_counter()
+            cached_response = None
+            llm_usage = {}
+            if faq_direct:
+                METRICS.counter("faq_answers_total", "Số câu hỏi được trả lời thẳng từ FAQ").inc()
+                text_stream = replay_stream(
+                    f"{faq_match.entry.content}\n\n*(Trả lời nhanh từ sổ tay kiến thức – chủ đề: {faq_match.topic})*"
+                )
+            else:
+                # Khóa = đúng các tin nhắn gửi đi (gồm lịch sử + tóm tắt) + mô hình + phiên bản chỉ mục PDF
+                cache_key = make_cache_key(
+                    messages_to_send, MODEL_NAME, question=prompt,
+                    index_fingerprint=None if rag_index is None else rag_index.fingerprint
+                )
+                cached_response = response_cache.get(cache_key)
+                if cached_response is not None:
+                    METRICS.counter("response_cache_hits_total", "Số câu trả lời lấy từ cache").inc()
+                    text_stream = replay_stream(cached_response)
+                else:
+                    METRICS.counter("response_cache_misses_total", "Số câu hỏi phải gọi Groq").inc()
+                    text_stream = llm_gateway.stream_chat(
+                        messages_to_send, # Gửi list tin nhắn đã xử lý RAG
+                        model=MODEL_NAME,
+                        usage=llm_usage,
+                        max_tokens=4096 # Tăng giới hạn token
+                    )
             
-            placeholder.markdown(bot_response_text) # Xóa dấu ▌ khi hoàn tất
+            # 2.6. Lặp qua từng "mẩu" văn bản (từ API hoặc phát lại từ cache).
+            # StreamRenderer gom các mẩu và chỉ vẽ lại tối đa ~12 lần/giây (không sleep).
+            renderer = StreamRenderer(placeholder.markdown, max_fps=12, started_at=request_started)
+            for delta in text_stream:
+                renderer.feed(delta)
+            bot_response_text = renderer.finish() # Vẽ lần cuối, xóa dấu ▌
+            stats = renderer.stats()
+            if cached_response is None and not faq_direct:
+                response_cache.put(cache_key, bot_response_text) # Chỉ lưu khi stream đã nhận đủ
+
+                # 2.7. Số liệu của lượt gọi Groq (token thật từ Groq nếu có, không thì dùng ước lượng)
+                tokens_in = llm_usage.get("prompt_tokens", token_breakdown["total"])
+                tokens_out = llm_usage.get("completion_tokens", stats["tokens"])
+                if stats["ttft"] is not None:
+                    METRICS.histogram("llm_ttft_seconds", "Thời gian tới token đầu tiên của Groq").observe(stats["ttft"])
+                METRICS.histogram("llm_stream_seconds", "Tổng thời gian stream câu trả lời của Groq").observe(stats["total"])
+                METRICS.counter("llm_tokens_in_total", "Tổng token gửi cho Groq").inc(tokens_in)
+                METRICS.counter("llm_tokens_out_total", "Tổng token Groq trả về").inc(tokens_out)
+            if retrieved_ids:
+                # 2.8. Ghi nguồn tham khảo (file PDF, trang) của các chunk đã gửi cho AI
+                citations = format_citations(rag_index.chunk_sources[i] for i in retrieved_ids)
+                bot_response_text += f"\n\n📚 *Tham khảo: {citations}*"
+                placeholder.markdown(bot_response_text)
+            METRICS.counter("chat_requests_total", "Số câu hỏi đã trả lời").inc()
+            METRICS.event(
+                "chat_request",
+                cache_hit=cached_response is not None,
+                faq_direct=faq_direct,
+                faq_score=None if faq_match is None else round(faq_match.score, 3),
+                faq_context=bool(faq_ids),
+                rag_chunks=len(retrieved_ids),
+                prompt_tokens=token_breakdown,
+                llm_usage=llm_usage,
+                ttft=stats["ttft"],
+                total_seconds=stats["total"],
+                tokens_out=stats["tokens"],
+                tokens_per_sec=stats["tokens_per_sec"],
+                renders=stats["renders"],
+            )
 
+    except LLMBusyError as e:
+        METRICS.counter("chat_errors_total", "Số lượt hỏi bị lỗi khi gọi Groq").inc()
+        with st.chat_message("assistant", avatar="✨"):
+            st.warning(f"Chatbook đang bận trả lời nhiều bạn cùng lúc. {e}")
+        bot_response_text = ""
     except Exception as e:
+        METRICS.counter("chat_errors_total", "Số lượt hỏi bị lỗi khi gọi Groq").inc()
+        METRICS.event("chat_error", error=f"{type(e).__name__}: {e}")
         with st.chat_message("assistant", avatar="✨"):
             st.error(f"Xin lỗi, đã xảy ra lỗi khi kết nối Groq: {e}")
         bot_response_text = ""
@@ -416,6 +552,12 @@ Câu hỏi: "{last_user_message_content}"
     if bot_response_text:
         st.session_state.messages.append({"role": "assistant", "content": bot_response_text})
 
+    # 3.5. Gấp các tin nhắn cũ vào bản tóm tắt để bộ nhớ phiên không tăng mãi
+    st.session_state.messages, st.session_state.conversation_summary, folded = fold_old_messages(
+        st.session_state.messages, st.session_state.conversation_summary, MAX_RENDERED_MESSAGES
+    )
+    st.session_state.conversation_archive.append(folded)
+
     # 4. Rerun nếu bấm nút
     if prompt_from_button:
         st.rerun()
\ No newline at end of file
@@ -0,0 +1,125 @@
+# Chọn chunk gửi cho AI sao cho ÍT TRÙNG LẶP và PHỦ RỘNG hơn (MMR - Maximal Marginal Relevance).
+# Chunk được chia với chunk_overlap=150 ký tự, nên các chunk liền nhau của cùng một đoạn văn
+# thường cùng điểm cao và chiếm hết các chỗ trong prompt với nội dung gần như giống nhau.
+# 1. Gộp các chunk ứng viên LIỀN NHAU (id liên tiếp, cùng file) thành một "đoạn" (span),
+#    bỏ phần văn bản chồng lấn -> không gửi trùng 150 ký tự cho AI.
+# 2. MMR trên các đoạn: mỗi bước chọn đoạn có
+#       lambda * độ liên quan - (1 - lambda) * độ giống lớn nhất với các đoạn đã chọn
+#    Độ giống = cosine giữa vector từ (điểm BM25) của các đoạn, tính một lần bằng phép nhân
+#    ma trận thưa; mỗi bước chỉ cập nhật một vector (numpy).
+# Mỗi đoạn tốn số "chỗ" bằng số chunk của nó, tổng không vượt num_chunks.
+
+import numpy as np
+from scipy import sparse
+
+MMR_LAMBDA = 0.7 # <-- 1.0 = chỉ xét độ liên quan (như cũ); nhỏ hơn = phạt trùng lặp mạnh hơn
+MAX_SPAN_CHUNKS = 2 # <-- Số chunk liền nhau tối đa gộp thành một đoạn
+SPAN_MIN_RELEVANCE = 0.5 # <-- Chỉ gộp chunk liền nhau khi cả hai đạt tỉ lệ này so với ứng viên tốt nhất
+
+
+class ChunkSpan:
+    """
+    Một đoạn văn gồm các chunk liền nhau của cùng một file.
+    - ids: id các chunk (tăng dần), text: nội dung đã bỏ phần chồng lấn
+    - score: điểm cao nhất của các chunk, source: (tên file, trang đầu, trang cuối)
+    """
+
+    def __init__(self, ids, text, score, source):
+        self.ids = ids
+        self.text = text
+        self.score = score
+        self.source = source
+
+
+def normalize_rows(matrix):
+    """Chuẩn hóa L2 từng dòng của ma trận thưa (dòng toàn 0 giữ nguyên)."""
+    matrix = sparse.csr_matrix(matrix, dtype=np.float32)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms) @ matrix
+
+
+def merge_overlapping_text(left, right, max_overlap):
+    """Nối hai chunk liền nhau, bỏ phần đầu của right đã lặp lại ở cuối left (nếu có)."""
+    probe = right[:16]
+    pos = left.find(probe, max(0, len(left) - max_overlap)) if probe else -1
+    while pos != -1: # Phần chồng lấn dài nhất = vị trí khớp sớm nhất trong đuôi của left
+        if right.startswith(left[pos:]):
+            return left + right[len(left) - pos:]
+        pos = left.find(probe, pos + 1)
+    return left + "\n" + right
+
+
+def _group_spans(doc_ids, scores, chunk_sources, max_span_chunks, min_relevance):
+    """
+    Gom các id liên tiếp của cùng file thành từng nhóm (mỗi nhóm tối đa max_span_chunks chunk).
+    Chunk điểm thấp (dưới min_relevance x điểm cao nhất) đứng riêng, để không kéo theo cả đoạn.
+    """
+    score_of = dict(zip(doc_ids, scores))
+    strong = max(score_of.values()) * min_relevance
+    groups = []
+    for i in sorted(score_of):
+        last = groups[-1] if groups else None
+        if (last and i == last[-1] + 1 and len(last) < max_span_chunks
+                and score_of[i] >= strong and score_of[last[-1]] >= strong
+                and chunk_sources[i][0] == chunk_sources[last[-1]][0]):
+            last.append(i)
+        else:
+            groups.append([i])
+    return groups, score_of
+
+
+def select_chunks(rag_index, doc_ids, scores, num_chunks=3, mmr_lambda=MMR_LAMBDA,
+                  max_span_chunks=MAX_SPAN_CHUNKS, min_span_relevance=SPAN_MIN_RELEVANCE, max_overlap=300):
+    """
+    Chọn các đoạn từ danh sách ứng viên (doc_ids, scores) của rag_index.search(...).
+    Trả về list ChunkSpan theo thứ tự được chọn (liên quan nhất trước), tổng số chunk <= num_chunks.
+    """
+    doc_ids = [int(i) for i in doc_ids]
+    if not doc_ids or num_chunks <= 0:
+        return []
+    scores = [float(s) for s in scores]
+    groups, score_of = _group_spans(doc_ids, scores, rag_index.chunk_sources,
+                                    max(1, min(max_span_chunks, num_chunks)), min_span_relevance)
+
+    # Độ liên quan của đoạn = điểm cao nhất trong đoạn, chuẩn hóa về [0, 1]
+    relevance = np.array([max(score_of[i] for i in g) for g in groups], dtype=np.float32)
+    relevance /= relevance.max() if relevance.max() > 0 else 1.0
+    cost = np.array([len(g) for g in groups])
+
+    # Vector của đoạn = tổng vector (đã chuẩn hóa) các chunk trong đoạn; sim = cosine giữa các đoạn.
+    # Chỉ một phép nhân ma trận thưa (giữa các chunk ứng viên), phần còn lại là numpy trên ma trận nhỏ
+    members = [i for g in groups for i in g]
+    chunk_vectors = rag_index.doc_vectors[members]
+    gram = (chunk_vectors @ chunk_vectors.T).toarray()
+    membership = np.zeros((len(groups), len(members)), dtype=np.float32)
+    membership[np.repeat(np.arange(len(groups)), cost), np.arange(len(members))] = 1.0
+    similarity = membership @ gram @ membership.T
+    norms = np.sqrt(np.maximum(np.diag(similarity), 1e-12))
+    similarity /= np.outer(norms, norms)
+
+    selected = []
+    max_similarity = np.zeros(len(groups), dtype=np.float32)
+    available = np.ones(len(groups), dtype=bool)
+    remaining = num_chunks
+    while remaining > 0:
+        available &= cost <= remaining
+        if not available.any():
+            break
+        mmr = mmr_lambda * relevance - (1 - mmr_lambda) * max_similarity
+        mmr[~available] = -np.inf
+        best = int(np.argmax(mmr))
+        selected.append(best)
+        available[best] = False
+        remaining -= cost[best]
+        np.maximum(max_similarity, similarity[:, best], out=max_similarity)
+
+    spans = []
+    for g in (groups[s] for s in selected):
+        text = rag_index.all_chunks[g[0]]
+        for i in g[1:]:
+            text = merge_overlapping_text(text, rag_index.all_chunks[i], max_overlap)
+        name, first, _ = rag_index.chunk_sources[g[0]]
+        last = rag_index.chunk_sources[g[-1]][2]
+        spans.append(ChunkSpan(g, text, max(score_of[i] for i in g), (name, first, last)))
+    return spans
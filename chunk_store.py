@@ -0,0 +1,180 @@
+# Kho chunk GỌN, ánh xạ bộ nhớ (mmap) chỉ-đọc, dùng chung giữa nhiều tiến trình Streamlit.
+# Thay vì list[str] (mỗi chunk là một object Python riêng, mỗi tiến trình giữ một bản),
+# toàn bộ chunk được lưu thành MỘT khối byte UTF-8 + các mảng song song:
+#   blob.bin        : nội dung mọi chunk nối liền nhau (UTF-8)
+#   offsets.npy     : int64, n+1 phần tử; chunk i = blob[offsets[i]:offsets[i+1]]
+#   file_ids.npy    : int32, số thứ tự file PDF của chunk i (tra tên trong files.json)
+#   page_first.npy  : int32, trang đầu của chunk i
+#   page_last.npy   : int32, trang cuối của chunk i
+#   files.json      : list tên file PDF
+# Các file được mmap chỉ-đọc, nên nhiều tiến trình cùng mở một kho chỉ tốn MỘT bản trong RAM
+# (bộ nhớ đệm trang của hệ điều hành). Kho nằm trong thư mục riêng theo fingerprint và
+# không bao giờ bị sửa sau khi ghi xong.
+
+import os
+import json
+import mmap
+import shutil
+
+import numpy as np
+
+STORE_DIR_NAME = "store"
+_ARRAY_NAMES = ("offsets", "file_ids", "page_first", "page_last")
+
+
+def format_citation(name, first_page, last_page):
+    """Trích dẫn dạng "VT12_GiaoTrinh_LyThuyet_Excel.pdf, tr. 34" ("tr. 34–35" nếu chunk vắt qua nhiều trang)."""
+    pages = f"{first_page}" if first_page == last_page else f"{first_page}–{last_page}"
+    return f"{name}, tr. {pages}"
+
+
+def format_citations(sources):
+    """Gộp nhiều nguồn theo file: "A.pdf, tr. 8, 26–27; B.pdf, tr. 3" (giữ thứ tự xuất hiện)."""
+    pages_by_file = {}
+    for name, first, last in sources:
+        pages = f"{first}" if first == last else f"{first}–{last}"
+        if pages not in pages_by_file.setdefault(name, []):
+            pages_by_file[name].append(pages)
+    return "; ".join(f"{name}, tr. {', '.join(pages)}" for name, pages in pages_by_file.items())
+
+
+def store_path(cache_dir, fingerprint):
+    return os.path.join(cache_dir, STORE_DIR_NAME, fingerprint)
+
+
+def _pack(chunks, sources):
+    """list chunk + list (tên file, trang đầu, trang cuối) -> (blob, offsets, file_ids, page_first, page_last, files)."""
+    files = []
+    file_numbers = {}
+    file_ids = np.empty(len(chunks), dtype=np.int32)
+    page_first = np.empty(len(chunks), dtype=np.int32)
+    page_last = np.empty(len(chunks), dtype=np.int32)
+    for i, (name, first, last) in enumerate(sources):
+        if name not in file_numbers:
+            file_numbers[name] = len(files)
+            files.append(name)
+        file_ids[i], page_first[i], page_last[i] = file_numbers[name], first, last
+
+    encoded = [c.encode("utf-8") for c in chunks]
+    offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return b"".join(encoded), offsets, file_ids, page_first, page_last, files
+
+
+def write_chunk_store(path, chunks, sources):
+    """
+    Ghi kho chunk vào thư mục path (ghi vào thư mục tạm rồi đổi tên, nên tiến trình khác
+    không bao giờ thấy kho ghi dở). sources: list (tên file, trang đầu, trang cuối).
+    """
+    if os.path.isdir(path):
+        return # Cùng fingerprint => cùng nội dung, đã có sẵn
+    blob, offsets, file_ids, page_first, page_last, files = _pack(chunks, sources)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    os.makedirs(tmp_path, exist_ok=True)
+    with open(os.path.join(tmp_path, "blob.bin"), "wb") as f:
+        f.write(blob)
+    for name, array in zip(_ARRAY_NAMES, (offsets, file_ids, page_first, page_last)):
+        np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+    with open(os.path.join(tmp_path, "files.json"), "w", encoding="utf-8") as f:
+        json.dump(files, f, ensure_ascii=False)
+    try:
+        os.rename(tmp_path, path)
+    except OSError: # Tiến trình khác vừa ghi xong cùng kho
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def remove_stale_stores(cache_dir, keep_fingerprint):
+    """Xóa các kho cũ. Tiến trình còn mmap kho cũ vẫn đọc được (Linux/macOS); lỗi thì bỏ qua."""
+    root = os.path.join(cache_dir, STORE_DIR_NAME)
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return
+    for name in names:
+        if name != keep_fingerprint:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+class ChunkStore:
+    """
+    Kho chunk chỉ-đọc, dùng như một list: len(store), store[i] -> str, for c in store.
+    - source(i): (tên file, trang đầu, trang cuối)
+    - citation(i): chuỗi trích dẫn nguồn
+    - sources: dãy (tên file, trang đầu, trang cuối) song song với các chunk
+    ChunkStore.open(path) mở kho trên đĩa (None nếu chưa có hoặc bị hỏng);
+    ChunkStore.from_lists(...) tạo kho trong RAM (khi không ghi được xuống đĩa).
+    """
+
+    def __init__(self, blob, offsets, file_ids, page_first, page_last, files):
+        self._blob = blob
+        self.offsets = offsets
+        self.file_ids = file_ids
+        self.page_first = page_first
+        self.page_last = page_last
+        self.files = files
+        self.sources = _SourceView(self)
+
+    @classmethod
+    def from_lists(cls, chunks, sources):
+        return cls(*_pack(chunks, sources))
+
+    @classmethod
+    def open(cls, path):
+        try:
+            arrays = [np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in _ARRAY_NAMES]
+            with open(os.path.join(path, "files.json"), "r", encoding="utf-8") as f:
+                files = json.load(f)
+            with open(os.path.join(path, "blob.bin"), "rb") as f:
+                # mmap giữ tham chiếu riêng tới file, đóng f không ảnh hưởng
+                blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        except (OSError, ValueError):
+            return None
+        offsets = arrays[0]
+        if len(offsets) == 0 or int(offsets[-1]) != len(blob) or any(len(a) != len(offsets) - 1 for a in arrays[1:]):
+            return None # Kho hỏng / không khớp
+        return cls(blob, *arrays, files)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._blob[int(self.offsets[i]):int(self.offsets[i + 1])].decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def source(self, i):
+        return self.files[int(self.file_ids[i])], int(self.page_first[i]), int(self.page_last[i])
+
+    def citation(self, i):
+        return format_citation(*self.source(i))
+
+    def nbytes(self):
+        """Dung lượng dữ liệu của kho (phần được mmap, dùng chung giữa các tiến trình)."""
+        return len(self._blob) + sum(a.nbytes for a in (self.offsets, self.file_ids, self.page_first, self.page_last))
+
+
+class _SourceView:
+    """Dãy (tên file, trang đầu, trang cuối) đọc thẳng từ các mảng của ChunkStore."""
+
+    def __init__(self, store):
+        self._store = store
+
+    def __len__(self):
+        return len(self._store)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._store.source(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._store.source(i)
@@ -0,0 +1,128 @@
+# Ghép prompt gửi cho AI theo NGÂN SÁCH TOKEN thay vì số tin nhắn cố định.
+# Thứ tự ưu tiên khi lấp ngân sách:
+#   1. SYSTEM_INSTRUCTION (luôn giữ)
+#   2. Câu hỏi hiện tại (luôn giữ)
+#   3. Các chunk RAG theo điểm từ cao xuống thấp (chunk không vừa thì bị cắt ngắn hoặc bỏ)
+#   4. Bản tóm tắt các lượt chat cũ (xem conversation_memory.py), nếu có và còn vừa
+#   5. Các lượt chat gần nhất, từ mới đến cũ (lượt cũ không vừa thì bỏ)
+# Số token được ƯỚC LƯỢNG (không cần tải tokenizer của mô hình): tiếng Việt có dấu
+# tốn nhiều token hơn tiếng Anh, nên ước lượng theo số byte UTF-8.
+
+import math
+
+BYTES_PER_TOKEN = 3.5 # <-- Ước lượng cho tokenizer của Llama 3 với văn bản tiếng Việt
+MESSAGE_OVERHEAD_TOKENS = 4 # <-- Token "vỏ" của mỗi tin nhắn (role, phân cách...)
+MIN_CHUNK_TOKENS = 80 # <-- Phần chunk còn lại ngắn hơn thế này thì bỏ luôn, không cắt
+
+RAG_PROMPT_TEMPLATE = """
+---
+BỐI CẢNH TRA CỨU TỪ SỔ TAY (RAG):
+{context}
+---
+DỰA VÀO BỐI CẢNH TRÊN (nếu liên quan), hãy trả lời câu hỏi sau đây một cách sư phạm và chi tiết:
+Câu hỏi: "{question}"
+"""
+CHUNK_SEPARATOR = "\n---\n"
+SUMMARY_PROMPT_TEMPLATE = "TÓM TẮT CÁC LƯỢT TRÒ CHUYỆN TRƯỚC ĐÓ VỚI HỌC SINH:\n{summary}"
+
+
+def estimate_tokens(text):
+    """Ước lượng số token của một đoạn văn bản."""
+    if not text:
+        return 0
+    return math.ceil(len(text.encode("utf-8")) / BYTES_PER_TOKEN)
+
+
+def _message_tokens(message):
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def _truncate_to_tokens(text, max_tokens):
+    """Cắt văn bản cho vừa max_tokens (ước lượng), ưu tiên cắt ở khoảng trắng."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    max_bytes = int(max_tokens * BYTES_PER_TOKEN)
+    cut = text.encode("utf-8")[:max_bytes].decode("utf-8", errors="ignore")
+    space = cut.rfind(" ")
+    if space > len(cut) // 2:
+        cut = cut[:space]
+    return cut + " …"
+
+
+def pack_context(system_prompt, question, history, chunks=(), budget=4000, summary=None):
+    """
+    Ghép list tin nhắn gửi cho AI trong phạm vi budget token (ước lượng).
+    - history: các tin nhắn TRƯỚC câu hỏi hiện tại ({"role", "content"}), cũ -> mới
+    - chunks: nội dung các chunk RAG, đã sắp xếp theo điểm giảm dần
+    - summary: bản tóm tắt các lượt chat cũ đã bị gấp khỏi history (hoặc None)
+    Trả về: (messages, breakdown) với breakdown là dict số token từng phần.
+    """
+    system_message = {"role": "system", "content": system_prompt}
+    used = _message_tokens(system_message)
+
+    # 1 + 2. System prompt và câu hỏi luôn được giữ (vỏ prompt RAG tính luôn vào câu hỏi)
+    template = RAG_PROMPT_TEMPLATE if chunks else "{question}"
+    question_tokens = _message_tokens({"content": template.format(context="", question=question)})
+    used += question_tokens
+
+    # 3. Chunk RAG theo thứ tự điểm
+    kept_chunks = []
+    for chunk in chunks:
+        remaining = budget - used - estimate_tokens(CHUNK_SEPARATOR)
+        chunk_tokens = estimate_tokens(chunk)
+        if chunk_tokens <= remaining:
+            kept_chunks.append(chunk)
+        elif remaining >= MIN_CHUNK_TOKENS:
+            kept_chunks.append(_truncate_to_tokens(chunk, remaining))
+        else:
+            break
+        used += estimate_tokens(kept_chunks[-1]) + estimate_tokens(CHUNK_SEPARATOR)
+    chunk_tokens_used = sum(estimate_tokens(c) + estimate_tokens(CHUNK_SEPARATOR) for c in kept_chunks)
+
+    if kept_chunks:
+        final_user = RAG_PROMPT_TEMPLATE.format(context=CHUNK_SEPARATOR.join(kept_chunks), question=question)
+    else:
+        final_user = question
+        used -= question_tokens # Không có chunk nào vừa -> gửi câu hỏi trần, tính lại
+        question_tokens = _message_tokens({"content": question})
+        used += question_tokens
+
+    # 4. Bản tóm tắt hội thoại cũ (giữ nguyên cả bản hoặc bỏ)
+    summary_messages = []
+    if summary:
+        summary_message = {"role": "system", "content": SUMMARY_PROMPT_TEMPLATE.format(summary=summary)}
+        if used + _message_tokens(summary_message) <= budget:
+            summary_messages.append(summary_message)
+            used += _message_tokens(summary_message)
+    summary_tokens = sum(_message_tokens(m) for m in summary_messages)
+
+    # 5. Lịch sử chat từ mới đến cũ, dừng ở lượt đầu tiên không còn vừa
+    kept_history = []
+    history_tokens = 0
+    for message in reversed(history):
+        tokens = _message_tokens(message)
+        if used + tokens > budget:
+            break
+        kept_history.append({"role": message["role"], "content": message["content"]})
+        used += tokens
+        history_tokens += tokens
+    kept_history.reverse()
+    # Lịch sử nên bắt đầu bằng câu hỏi của user, không bắt đầu giữa chừng bằng câu trả lời
+    while kept_history and kept_history[0]["role"] == "assistant":
+        history_tokens -= _message_tokens(kept_history.pop(0))
+
+    messages = [system_message] + summary_messages + kept_history + [{"role": "user", "content": final_user}]
+    breakdown = {
+        "system": _message_tokens(system_message),
+        "question": question_tokens,
+        "chunks": chunk_tokens_used,
+        "chunks_kept": len(kept_chunks),
+        "chunks_total": len(chunks),
+        "summary": summary_tokens,
+        "history": history_tokens,
+        "history_kept": len(kept_history),
+        "history_total": len(history),
+        "total": sum(_message_tokens(m) for m in messages),
+        "budget": budget,
+    }
+    return messages, breakdown
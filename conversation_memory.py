@@ -0,0 +1,113 @@
+# Giữ bộ nhớ của một phiên chat luôn GỌN dù buổi học kéo dài:
+# - Chỉ giữ đầy đủ N tin nhắn gần nhất trong st.session_state.messages (để vẽ và gửi AI).
+# - Các tin nhắn cũ hơn được "gấp" vào một bản tóm tắt ngắn (không gọi AI, chỉ trích
+#   câu đầu của mỗi lượt) có độ dài tối đa cố định -> dùng làm bối cảnh cho prompt.
+# - Nội dung đầy đủ của tin nhắn cũ được ghi ra file tạm (JSONL) của phiên, chỉ đọc lại
+#   khi người dùng muốn xem ("tải lười"), nên RAM của mỗi phiên không tăng theo thời gian.
+
+import os
+import re
+import json
+import time
+import tempfile
+
+SUMMARY_MAX_CHARS = 1500 # <-- Độ dài tối đa của bản tóm tắt; dòng cũ nhất bị bỏ khi vượt
+ARCHIVE_DIR = os.path.join(tempfile.gettempdir(), "chatbot_ktc_sessions")
+ARCHIVE_MAX_AGE = 24 * 3600 # <-- File lưu trữ của phiên bỏ dở quá 1 ngày sẽ bị xóa
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?:])\s")
+_MARKDOWN_RE = re.compile(r"[*_#`>|]+")
+
+
+def _first_sentence(text, max_chars):
+    """Câu đầu tiên (đã bỏ ký hiệu markdown), cắt ngắn nếu dài quá max_chars."""
+    text = " ".join(_MARKDOWN_RE.sub("", text).split())
+    sentence = _SENTENCE_END_RE.split(text, maxsplit=1)[0]
+    if len(sentence) > max_chars:
+        sentence = sentence[:max_chars].rsplit(" ", 1)[0] + "…"
+    return sentence
+
+
+def summarize_messages(messages):
+    """Tóm tắt trích xuất: mỗi tin nhắn một dòng."""
+    lines = []
+    for message in messages:
+        if message["role"] == "user":
+            lines.append(f"- HS hỏi: {_first_sentence(message['content'], 160)}")
+        else:
+            lines.append(f"  Đã trả lời: {_first_sentence(message['content'], 220)}")
+    return "\n".join(lines)
+
+
+def merge_summary(summary, new_lines, max_chars=SUMMARY_MAX_CHARS):
+    """Nối thêm dòng tóm tắt mới; bỏ các dòng cũ nhất nếu vượt max_chars."""
+    lines = [line for line in (summary or "").split("\n") + new_lines.split("\n") if line]
+    while lines and sum(len(line) + 1 for line in lines) > max_chars:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def fold_old_messages(messages, summary, keep_last):
+    """
+    Giữ tối đa keep_last tin nhắn cuối; phần cũ hơn được gấp vào bản tóm tắt.
+    Luôn cắt sao cho cửa sổ giữ lại bắt đầu bằng tin nhắn của user.
+    Trả về: (tin nhắn giữ lại, bản tóm tắt mới, tin nhắn đã gấp).
+    """
+    if len(messages) <= keep_last:
+        return messages, summary, []
+    cut = len(messages) - keep_last
+    while cut < len(messages) and messages[cut]["role"] != "user":
+        cut += 1
+    folded = messages[:cut]
+    return messages[cut:], merge_summary(summary, summarize_messages(folded)), folded
+
+
+class ConversationArchive:
+    """File JSONL chứa các tin nhắn đã gấp của MỘT phiên chat."""
+
+    def __init__(self, session_id, archive_dir=ARCHIVE_DIR):
+        self.path = os.path.join(archive_dir, f"{session_id}.jsonl")
+        self.count = 0
+
+    def append(self, messages):
+        if not messages:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                for message in messages:
+                    f.write(json.dumps({"role": message["role"], "content": message["content"]}, ensure_ascii=False) + "\n")
+            self.count += len(messages)
+        except OSError as e:
+            print(f"Không ghi được lịch sử cũ ra {self.path}: {e}")
+
+    def load(self):
+        """Đọc lại toàn bộ tin nhắn đã gấp (chỉ gọi khi người dùng muốn xem)."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except (OSError, ValueError):
+            return []
+
+    def clear(self):
+        self.count = 0
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def cleanup_old_archives(archive_dir=ARCHIVE_DIR, max_age=ARCHIVE_MAX_AGE):
+    """Xóa file lưu trữ của các phiên đã bỏ dở quá max_age giây."""
+    now = time.time()
+    try:
+        names = os.listdir(archive_dir)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(archive_dir, name)
+        try:
+            if name.endswith(".jsonl") and now - os.path.getmtime(path) > max_age:
+                os.remove(path)
+        except OSError:
+            pass
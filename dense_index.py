@@ -0,0 +1,167 @@
+# Chỉ mục "ngữ nghĩa" (dense) dựng hoàn toàn OFFLINE từ chính kho chunk, không cần tải mô hình embedding.
+# - LSA: SVD rút gọn (truncated SVD) trên ma trận chunk x từ (điểm BM25, chuẩn hóa L2) -> mỗi chunk
+#   và mỗi câu hỏi là một vector DENSE_DIM chiều; các từ hay đi cùng nhau ("bộ nhớ tạm", "RAM")
+#   gần nhau trong không gian này, nên bắt được câu hỏi diễn đạt khác với sách.
+# - Chỉ giữ từ xuất hiện ở >= DENSE_MIN_DF chunk; vector lưu dạng float16 (mmap được từ đĩa).
+# - Tìm láng giềng gần đúng kiểu IVF: k-means (cosine) chia chunk thành ~sqrt(n) cụm; câu hỏi chỉ so
+#   với các chunk của DENSE_NPROBE cụm gần nhất -> thời gian tìm tăng theo ~sqrt(số chunk).
+# - Kết hợp với xếp hạng BM25 bằng Reciprocal Rank Fusion có trọng số (reciprocal_rank_fusion):
+#   BM25 vẫn chính xác hơn khi câu hỏi dùng đúng từ của sách, nên được trọng số cao hơn.
+
+import os
+import shutil
+
+import numpy as np
+from scipy.sparse.linalg import svds
+
+from chunk_select import normalize_rows
+
+DENSE_DIM = 128 # <-- Số chiều của vector LSA
+DENSE_MIN_DF = 2 # <-- Bỏ từ chỉ xuất hiện trong 1 chunk (không mang thông tin "đồng xuất hiện")
+DENSE_NPROBE = 4 # <-- Số cụm IVF được duyệt mỗi câu hỏi
+DENSE_KMEANS_ITERATIONS = 20
+DENSE_MIN_SIMILARITY = 0.4 # <-- Cosine tối thiểu để một chunk được coi là ứng viên dense
+RRF_K = 10 # <-- Hằng số của Reciprocal Rank Fusion: điểm = tổng trọng số / (RRF_K + hạng)
+HYBRID_LEXICAL_WEIGHT = 2.0 # <-- Trọng số của xếp hạng BM25 so với LSA (1.0) khi gộp
+_ARRAY_NAMES = ("term_rows", "projection", "doc_vectors", "centroids", "list_offsets", "list_docs")
+_ASSIGN_BLOCK_ROWS = 8192 # Gán cụm theo khối để ma trận (chunk x cụm) không quá lớn
+
+
+def _assign_clusters(vectors, centroids):
+    """Cụm gần nhất (cosine) của từng vector, tính theo khối dòng."""
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), _ASSIGN_BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + _ASSIGN_BLOCK_ROWS], dtype=np.float32)
+        assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignment
+
+
+def _spherical_kmeans(vectors, num_clusters, iterations, rng):
+    """k-means theo cosine (vector đã chuẩn hóa L2). Trả về (centroids, assignment)."""
+    centroids = vectors[rng.choice(len(vectors), num_clusters, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assignment = _assign_clusters(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids) # Cụm rỗng giữ tâm cũ
+    return centroids, _assign_clusters(vectors, centroids)
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K, weights=None):
+    """
+    Gộp nhiều danh sách xếp hạng (list doc_id, tốt nhất trước) bằng RRF; weights: trọng số
+    của từng danh sách (mặc định đều 1.0).
+    Trả về (doc_ids, scores) theo điểm giảm dần (hòa điểm thì id nhỏ trước).
+    """
+    fused = {}
+    for ranking, weight in zip(rankings, weights or [1.0] * len(rankings)):
+        for rank, doc_id in enumerate(ranking, 1):
+            fused[int(doc_id)] = fused.get(int(doc_id), 0.0) + weight / (k + rank)
+    if not fused:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    doc_ids = np.fromiter(fused.keys(), dtype=np.int64, count=len(fused))
+    scores = np.fromiter(fused.values(), dtype=np.float32, count=len(fused))
+    order = np.lexsort((doc_ids, -scores))
+    return doc_ids[order], scores[order]
+
+
+class DenseIndex:
+    """
+    Chỉ mục LSA + IVF.
+    - term_rows: int32 (số từ,), dòng của từ trong projection, -1 nếu từ bị bỏ
+    - projection: float16 (số từ giữ lại x DENSE_DIM), chiếu vector từ của câu hỏi vào không gian LSA
+    - doc_vectors: float16 (số chunk x DENSE_DIM), đã chuẩn hóa L2
+    - centroids: float32 (số cụm x DENSE_DIM); list_docs[list_offsets[c]:list_offsets[c+1]] = chunk của cụm c
+    """
+
+    def __init__(self, term_rows, projection, doc_vectors, centroids, list_offsets, list_docs):
+        self.term_rows = term_rows
+        self.projection = projection
+        self.doc_vectors = doc_vectors
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_docs = list_docs
+
+    @classmethod
+    def build(cls, bm25, dim=DENSE_DIM, min_df=DENSE_MIN_DF, iterations=DENSE_KMEANS_ITERATIONS, seed=0):
+        """Dựng từ chỉ mục BM25 (dùng lại ma trận posting); None nếu kho quá nhỏ."""
+        postings = bm25.postings # CSC: chunk x từ
+        kept_terms = np.flatnonzero(np.diff(postings.indptr) >= min_df)
+        num_docs = postings.shape[0]
+        if num_docs < 3 or len(kept_terms) < 3:
+            return None
+        matrix = normalize_rows(postings[:, kept_terms])
+        dim = min(dim, min(matrix.shape) - 1)
+        rng = np.random.default_rng(seed)
+        v0 = rng.standard_normal(min(matrix.shape)) # Cố định điểm xuất phát -> kết quả lặp lại được
+        _, _, vt = svds(matrix, k=dim, v0=v0)
+        projection = np.ascontiguousarray(vt.T, dtype=np.float32)
+
+        doc_vectors = np.asarray(matrix @ projection, dtype=np.float32)
+        doc_vectors /= np.maximum(np.linalg.norm(doc_vectors, axis=1, keepdims=True), 1e-12)
+
+        num_clusters = max(1, int(round(np.sqrt(num_docs))))
+        centroids, assignment = _spherical_kmeans(doc_vectors, num_clusters, iterations, rng)
+        list_docs = np.argsort(assignment, kind="stable").astype(np.int32)
+        list_offsets = np.zeros(num_clusters + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=num_clusters), out=list_offsets[1:])
+
+        term_rows = np.full(len(bm25.vocabulary), -1, dtype=np.int32)
+        term_rows[kept_terms] = np.arange(len(kept_terms), dtype=np.int32)
+        return cls(term_rows, projection.astype(np.float16), doc_vectors.astype(np.float16),
+                   centroids.astype(np.float32), list_offsets, list_docs)
+
+    def save(self, path):
+        """Lưu vào thư mục path (ghi thư mục tạm rồi đổi tên)."""
+        if os.path.isdir(path):
+            return
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        os.makedirs(tmp_path, exist_ok=True)
+        for name in _ARRAY_NAMES:
+            np.save(os.path.join(tmp_path, f"{name}.npy"), getattr(self, name))
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    @classmethod
+    def open(cls, path):
+        """Mở chỉ mục đã lưu (mmap chỉ-đọc, dùng chung giữa các tiến trình); None nếu chưa có/hỏng."""
+        try:
+            arrays = [np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in _ARRAY_NAMES]
+        except (OSError, ValueError):
+            return None
+        return cls(*arrays)
+
+    @property
+    def num_docs(self):
+        return len(self.doc_vectors)
+
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in _ARRAY_NAMES)
+
+    def embed(self, term_ids, weights):
+        """Vector (chuẩn hóa L2) của câu hỏi từ các từ và trọng số (IDF); None nếu không có từ nào."""
+        rows = self.term_rows[term_ids]
+        known = rows >= 0
+        if not known.any():
+            return None
+        vector = weights[known].astype(np.float32) @ np.asarray(self.projection[rows[known]], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    def search(self, term_ids, weights, k=10, nprobe=DENSE_NPROBE):
+        """Top-k chunk theo cosine, chỉ duyệt nprobe cụm gần nhất. Trả về (doc_ids, similarities)."""
+        query = self.embed(term_ids, weights)
+        if query is None or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        nprobe = min(nprobe, len(self.centroids))
+        probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        candidates = np.concatenate([self.list_docs[self.list_offsets[c]:self.list_offsets[c + 1]] for c in probe])
+        similarities = np.asarray(self.doc_vectors[candidates], dtype=np.float32) @ query
+        if len(candidates) > k:
+            part = np.argpartition(-similarities, k - 1)[:k]
+            candidates, similarities = candidates[part], similarities[part]
+        order = np.lexsort((candidates, -similarities))
+        return candidates[order].astype(np.int64), similarities[order]
@@ -0,0 +1,234 @@
+# "Đường tắt" FAQ: các mục kiến thức do giáo viên soạn sẵn trong kienthuc.txt.
+# Định dạng file (các mục cách nhau bởi dòng trống hoặc bắt đầu bằng "Chủ đề:"):
+#   Chủ đề: gà chó, bài toán gà chó, bài toán cổ     <- các cách gọi của chủ đề, ngăn bởi dấu phẩy
+#   Nội dung: Đề bài toán cổ ...                       <- có thể kéo dài nhiều dòng (giữ nguyên xuống dòng)
+# Nhãn "Chủ đề:" / "Nội dung:" phải ở ĐẦU dòng; dòng bắt đầu bằng khoảng trắng luôn là nội dung.
+# - Chỉ mục từ khóa: âm tiết BỎ dấu của chủ đề -> các mục chứa nó (chỉ để tìm ứng viên)
+# - So âm tiết: câu hỏi có gõ dấu thì phải khớp ĐÚNG dấu ("cho" không khớp "chó", "có" không khớp "cổ");
+#   chỉ câu hỏi gõ không dấu hoàn toàn (hoặc chủ đề viết không dấu) mới so ở dạng bỏ dấu
+# - Khớp gần đúng: chấp nhận gõ sai nhẹ (difflib), nhưng kết quả có dùng khớp gần đúng (fuzzy)
+#   không bao giờ được trả lời thẳng
+# - Điểm khớp trong [0, 1]: điểm rất cao -> trả lời ngay bằng nội dung soạn sẵn, không gọi AI;
+#   điểm khá -> đưa nội dung vào đầu bối cảnh RAG (ưu tiên hơn chunk PDF).
+# - Thêm mục mới bằng append_entry(); file thay đổi thì FaqStore tự đọc lại.
+# - Kết quả match() được nhớ theo câu hỏi cho tới lần đọc lại file (nút gợi ý không phải khớp lại).
+
+import os
+import re
+import difflib
+import threading
+import unicodedata
+
+from bm25_search import fold_accents
+
+FAQ_ANSWER_THRESHOLD = 0.95 # <-- Từ điểm này trở lên: trả lời ngay bằng nội dung FAQ
+FAQ_CONTEXT_THRESHOLD = 0.6 # <-- Từ điểm này trở lên: đưa FAQ vào bối cảnh cho AI
+FUZZY_CUTOFF = 0.8 # <-- Độ giống tối thiểu để coi hai âm tiết là một (gõ sai nhẹ)
+MATCH_CACHE_SIZE = 1024 # <-- Số câu hỏi nhớ kết quả match() tối đa (đầy thì xóa hết, nhớ lại từ đầu)
+
+_SYLLABLE_RE = re.compile(r"\w+", re.UNICODE)
+_FIELD_RE = re.compile(r"^(Chủ đề|Nội dung)\s*:\s*(.*)$", re.IGNORECASE)
+
+# Các âm tiết "đệm" của câu hỏi, không tính khi so độ khớp. So ở dạng CÓ dấu vì
+# bỏ dấu thì dễ trùng với từ có nghĩa ("cho" / "chó", "về" / "vẽ")
+FILLER_SYLLABLES = frozenset(
+    "là gì gi em hỏi hãy nêu trình bày về với nhé ạ ơi thế nào vậy chatbook".split()
+)
+# Câu hỏi gõ không dấu hoàn toàn thì không phân biệt được nữa, so từ đệm ở dạng bỏ dấu
+PLAIN_FILLER_SYLLABLES = frozenset(fold_accents(s) for s in FILLER_SYLLABLES)
+
+
+def _syllables(text):
+    """Âm tiết (chữ thường, NFC, GIỮ dấu) của văn bản."""
+    return _SYLLABLE_RE.findall(unicodedata.normalize("NFC", text.lower()))
+
+
+def _is_plain(syllable):
+    """Âm tiết không có dấu ("cho", "bai")."""
+    return fold_accents(syllable) == syllable
+
+
+def _syllables_match(word, key, fuzzy, topic_syllable, accented_question):
+    """
+    Âm tiết word của câu hỏi (key: dạng bỏ dấu trong chỉ mục, fuzzy: key tìm được nhờ khớp gần đúng)
+    có khớp âm tiết topic_syllable của chủ đề không.
+    """
+    if fold_accents(topic_syllable) != key:
+        return False
+    if not accented_question or _is_plain(topic_syllable):
+        return True # Câu hỏi gõ không dấu / chủ đề viết không dấu: so ở dạng bỏ dấu
+    if not fuzzy:
+        return word == topic_syllable
+    return difflib.SequenceMatcher(None, word, topic_syllable).ratio() >= FUZZY_CUTOFF
+
+
+class FaqEntry:
+    """Một mục FAQ: entry_id (số thứ tự trong file), topics (các cách gọi chủ đề), content."""
+
+    def __init__(self, entry_id, topics, content):
+        self.entry_id = entry_id
+        self.topics = topics
+        self.content = content
+
+    def as_context(self):
+        """Nội dung dạng chunk bối cảnh gửi cho AI."""
+        return f"Chủ đề: {', '.join(self.topics)}\nNội dung: {self.content}"
+
+
+class FaqMatch:
+    """
+    Kết quả khớp: entry, score (0..1), topic (cách gọi chủ đề khớp nhất),
+    fuzzy (True nếu có âm tiết chỉ khớp nhờ chấp nhận gõ sai -> không dùng để trả lời thẳng).
+    """
+
+    def __init__(self, entry, score, topic, fuzzy=False):
+        self.entry = entry
+        self.score = score
+        self.topic = topic
+        self.fuzzy = fuzzy
+
+
+def parse_faq_text(text):
+    """Đọc các mục "Chủ đề: … / Nội dung: …"; mục thiếu chủ đề hoặc nội dung bị bỏ qua."""
+    entries = []
+    topics, content = None, None
+
+    def flush():
+        if topics and content and content.strip():
+            entries.append(FaqEntry(len(entries), topics, content.strip()))
+
+    for line in text.splitlines():
+        match = _FIELD_RE.match(line)
+        if match and match.group(1).lower() == "chủ đề":
+            flush()
+            topics = [t.strip() for t in match.group(2).split(",") if t.strip()]
+            content = None
+        elif match:
+            content = match.group(2)
+        elif content is not None:
+            content += "\n" + line.strip() # Nội dung nhiều dòng (dòng trống giữ lại để tách đoạn)
+    flush()
+    return entries
+
+
+def append_entry(path, topics, content):
+    """
+    Thêm một mục FAQ vào cuối file (tạo file nếu chưa có), giữ nguyên các dòng của nội dung.
+    Dòng nội dung trông như nhãn ("Chủ đề: …") được thụt vào một khoảng trắng để không mở mục mới.
+    """
+    lines = [line.rstrip() for line in content.strip().splitlines()]
+    lines[1:] = [" " + line if _FIELD_RE.match(line) else line for line in lines[1:]]
+    block = f"Chủ đề: {', '.join(topics)}\r\nNội dung: " + "\r\n".join(lines)
+    needs_gap = os.path.exists(path) and os.path.getsize(path) > 0
+    with open(path, "a", encoding="utf-8", newline="") as f:
+        f.write(("\r\n\r\n" if needs_gap else "") + block)
+
+
+class FaqStore:
+    """
+    Kho FAQ đọc từ file, an toàn khi nhiều phiên dùng chung.
+    match(question) trả về FaqMatch tốt nhất hoặc None.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = []
+        # (topics, keyword_index, matches): topics là list (entry, topic, âm tiết (có dấu) của topic),
+        # keyword_index là dict {âm tiết bỏ dấu: set chỉ số trong topics},
+        # matches là dict {câu hỏi: FaqMatch hoặc None} đã tính với đúng dữ liệu này
+        self._index = ([], {}, {})
+        self._mtime = None
+        self._lock = threading.Lock()
+        self.reload_if_changed()
+
+    def reload_if_changed(self):
+        """Đọc lại file nếu đã bị sửa (so mtime); gọi mỗi câu hỏi vẫn rẻ (một lần stat)."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return False
+        with self._lock:
+            if mtime == self._mtime:
+                return False
+            text = ""
+            if mtime is not None:
+                with open(self.path, "r", encoding="utf-8-sig") as f:
+                    text = f.read()
+            entries = parse_faq_text(text)
+            topics, keyword_index = [], {}
+            for entry in entries:
+                for topic in entry.topics:
+                    syllables = _syllables(topic)
+                    if not syllables:
+                        continue
+                    for s in {fold_accents(s) for s in syllables}:
+                        keyword_index.setdefault(s, set()).add(len(topics))
+                    topics.append((entry, topic, syllables))
+            # Thay cả bộ bằng MỘT phép gán: phiên khác đang match() vẫn thấy dữ liệu nhất quán
+            self._index = (topics, keyword_index, {})
+            self.entries = entries
+            self._mtime = mtime
+            print(f"--- ĐÃ TẢI {len(entries)} MỤC FAQ TỪ {self.path} ---")
+            return True
+
+    def _resolve(self, syllable, keyword_index):
+        """
+        Âm tiết (bỏ dấu) của câu hỏi -> (âm tiết có trong chỉ mục, có phải khớp gần đúng không),
+        hoặc (None, False) nếu không tìm thấy.
+        """
+        if syllable in keyword_index:
+            return syllable, False
+        if len(syllable) < 3:
+            return None, False # Âm tiết ngắn dễ khớp nhầm
+        close = difflib.get_close_matches(syllable, keyword_index.keys(), n=1, cutoff=FUZZY_CUTOFF)
+        return (close[0], True) if close else (None, False)
+
+    def match(self, question):
+        """
+        Điểm của một cách gọi chủ đề = độ phủ x độ tập trung:
+        - độ phủ: tỉ lệ âm tiết của chủ đề có mặt trong câu hỏi
+        - độ tập trung: tỉ lệ âm tiết (không phải từ đệm) của câu hỏi thuộc chủ đề
+        Câu hỏi "bài toán gà chó là gì?" khớp trọn chủ đề "bài toán gà chó" -> 1.0;
+        "cho em hỏi bài toán là gì?" không khớp "chó" (câu hỏi có dấu nên so đúng dấu).
+        """
+        topics, keyword_index, matches = self._index
+        if question in matches:
+            return matches[question]
+        best = self._match(question, topics, keyword_index) if topics else None
+        if len(matches) >= MATCH_CACHE_SIZE:
+            matches.clear()
+        matches[question] = best
+        return best
+
+    def _match(self, question, topics, keyword_index):
+        words = _syllables(question)
+        accented_question = any(not _is_plain(w) for w in words)
+        fillers = FILLER_SYLLABLES if accented_question else PLAIN_FILLER_SYLLABLES
+        words = [w for w in words if w not in fillers]
+        resolved = [self._resolve(fold_accents(w), keyword_index) for w in words]
+        candidates = set()
+        for key, _ in resolved:
+            if key is not None:
+                candidates |= keyword_index[key]
+        if not candidates:
+            return None
+
+        best = None
+        for i in candidates:
+            entry, topic, syllables = topics[i]
+            covered, matched_words, fuzzy = set(), 0, False
+            for word, (key, is_fuzzy) in zip(words, resolved):
+                if key is None:
+                    continue
+                hits = [j for j, t in enumerate(syllables)
+                        if _syllables_match(word, key, is_fuzzy, t, accented_question)]
+                if hits:
+                    covered.update(hits)
+                    matched_words += 1
+                    fuzzy = fuzzy or is_fuzzy
+            score = len(covered) / len(syllables) * matched_words / len(words)
+            if best is None or score > best.score or (score == best.score and best.fuzzy and not fuzzy):
+                best = FaqMatch(entry, score, topic, fuzzy)
+        return best if best.score > 0 else None
@@ -0,0 +1,134 @@
+# Cổng gọi LLM DÙNG CHUNG cho cả tiến trình (mọi phiên chat của Streamlit):
+# - Một client Groq duy nhất với pool kết nối HTTP (httpx) -> tái sử dụng kết nối keep-alive
+# - Giới hạn số yêu cầu đang chạy cùng lúc bằng semaphore; yêu cầu vượt quá phải XẾP HÀNG
+#   (chờ tối đa queue_timeout giây rồi báo "hệ thống đang bận")
+# - Thử lại với thời gian chờ ngẫu nhiên ("jitter") khi gặp 429 / lỗi 5xx / lỗi kết nối,
+#   chỉ khi CHƯA nhận được mẩu văn bản nào (không thể thử lại giữa chừng một stream)
+# - Trả về từng mẩu văn bản ngay khi nhận được (stream xuyên suốt)
+# Muốn chạy thử không cần mạng: chạy mock_llm_server.py rồi đặt biến môi trường
+# GROQ_BASE_URL=http://127.0.0.1:8008 (client Groq tự đọc biến này).
+
+import time
+import random
+import threading
+
+import httpx
+from groq import Groq, APIConnectionError, APIStatusError
+
+from metrics import REGISTRY as METRICS
+
+MAX_CONCURRENT_REQUESTS = 8 # <-- Số yêu cầu gửi Groq cùng lúc tối đa
+QUEUE_TIMEOUT = 30.0 # <-- Thời gian chờ tối đa trong hàng đợi (giây)
+MAX_RETRIES = 3 # <-- Số lần thử lại khi gặp 429/5xx
+RETRY_BASE_DELAY = 0.5 # <-- Thời gian chờ cơ bản (giây), tăng gấp đôi sau mỗi lần thử
+RETRY_MAX_DELAY = 8.0
+REQUEST_TIMEOUT = 60.0
+
+
+class LLMBusyError(Exception):
+    """Hàng đợi quá lâu: đã có quá nhiều yêu cầu đang chạy."""
+
+
+def _is_retryable(error):
+    if isinstance(error, APIConnectionError): # Gồm cả APITimeoutError
+        return True
+    return isinstance(error, APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+
+def _retry_after(error):
+    """Số giây server yêu cầu chờ (header Retry-After), nếu có."""
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class LLMGateway:
+    def __init__(self, api_key, base_url=None, max_concurrent=MAX_CONCURRENT_REQUESTS,
+                 queue_timeout=QUEUE_TIMEOUT, max_retries=MAX_RETRIES, timeout=REQUEST_TIMEOUT):
+        self._http = httpx.Client(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_concurrent, max_keepalive_connections=max_concurrent),
+        )
+        # max_retries=0: việc thử lại do gateway tự làm (có jitter và tính cả thời gian xếp hàng)
+        self.client = Groq(api_key=api_key, base_url=base_url, max_retries=0, http_client=self._http)
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+
+    def _acquire(self):
+        with self._lock:
+            self.waiting += 1
+        start = time.perf_counter()
+        try:
+            acquired = self._slots.acquire(timeout=self.queue_timeout)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        METRICS.histogram("llm_queue_wait_seconds", "Thời gian xếp hàng chờ gọi Groq").observe(time.perf_counter() - start)
+        if not acquired:
+            METRICS.counter("llm_queue_timeouts_total", "Số yêu cầu bị từ chối vì chờ quá lâu").inc()
+            raise LLMBusyError(f"Đang có quá nhiều yêu cầu (tối đa {self.max_concurrent}), vui lòng thử lại sau.")
+        with self._lock:
+            self.in_flight += 1
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def stream_chat(self, messages, model, usage=None, **params):
+        """
+        Generator trả về từng mẩu văn bản của câu trả lời.
+        usage: dict (tùy chọn) để nhận số token thật nếu server gửi kèm (x_groq.usage hoặc usage).
+        Chỉ chiếm một chỗ trong semaphore khi bắt đầu lặp, và trả lại chỗ khi stream kết thúc/bị hủy.
+        """
+        self._acquire()
+        try:
+            attempt = 0
+            while True:
+                received_text = False
+                try:
+                    stream = self.client.chat.completions.create(
+                        messages=messages, model=model, stream=True, **params
+                    )
+                    for chunk in stream:
+                        _record_usage(chunk, usage)
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            received_text = True
+                            yield chunk.choices[0].delta.content
+                    return
+                except Exception as e:
+                    if received_text or attempt >= self.max_retries or not _is_retryable(e):
+                        raise
+                    # "Full jitter": chờ ngẫu nhiên trong [0, base * 2^attempt], không quá RETRY_MAX_DELAY
+                    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+                    delay = max(delay, min(_retry_after(e) or 0.0, RETRY_MAX_DELAY))
+                    attempt += 1
+                    METRICS.counter("llm_retries_total", "Số lần thử lại khi gọi Groq").inc()
+                    print(f"Groq lỗi ({type(e).__name__}), thử lại lần {attempt} sau {delay:.2f}s")
+                    time.sleep(delay)
+        finally:
+            self._release()
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": self.in_flight, "waiting": self.waiting, "max_concurrent": self.max_concurrent}
+
+    def close(self):
+        self._http.close()
+
+
+def _record_usage(chunk, usage):
+    if usage is None:
+        return
+    x_groq = getattr(chunk, "x_groq", None)
+    found = getattr(x_groq, "usage", None) or getattr(chunk, "usage", None)
+    if found is not None:
+        usage["prompt_tokens"] = found.prompt_tokens
+        usage["completion_tokens"] = found.completion_tokens
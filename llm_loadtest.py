@@ -0,0 +1,118 @@
+# Đo tải cổng gọi LLM (llm_gateway.py) với nhiều "học sinh" hỏi cùng lúc, KHÔNG cần mạng.
+# Chạy bằng lệnh: python llm_loadtest.py
+#   --users 32          số luồng gửi câu hỏi cùng lúc
+#   --requests 4        số câu hỏi mỗi luồng
+#   --base-url URL      server cần đo; bỏ trống thì tự bật mock_llm_server.py ở cổng --port
+#   --error-rate 0.1    (chỉ với server tự bật) tỉ lệ lỗi 429 giả lập
+# Kết quả: TTFT và tổng thời gian p50/p95/p99, thông lượng, số lần thử lại / lỗi.
+
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from metrics import REGISTRY as METRICS
+from llm_gateway import LLMGateway, MAX_CONCURRENT_REQUESTS
+from mock_llm_server import start_mock_server
+
+LOADTEST_MESSAGES = [
+    {"role": "system", "content": "Bạn là Chatbook, cố vấn học tập Tin học."},
+    {"role": "user", "content": "Giải thích về 'biến' trong lập trình?"},
+]
+
+
+def run_one(gateway, model):
+    started = time.perf_counter()
+    ttft = None
+    tokens = 0
+    for _ in gateway.stream_chat(LOADTEST_MESSAGES, model=model, max_tokens=512):
+        if ttft is None:
+            ttft = time.perf_counter() - started
+        tokens += 1
+    return ttft, time.perf_counter() - started, tokens
+
+
+def _percentiles(values):
+    values = np.asarray([v for v in values if v is not None]) * 1000
+    if values.size == 0:
+        return {}
+    return {f"p{q}_ms": float(np.percentile(values, q)) for q in (50, 95, 99)}
+
+
+def run_load_test(base_url, users, requests_per_user, max_concurrent, model="mock-model"):
+    gateway = LLMGateway(api_key="mock-key", base_url=base_url, max_concurrent=max_concurrent)
+    results, errors = [], []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(requests_per_user):
+            try:
+                result = run_one(gateway, model)
+                with lock:
+                    results.append(result)
+            except Exception as e:
+                with lock:
+                    errors.append(f"{type(e).__name__}: {e}")
+
+    retries_before = METRICS.counter("llm_retries_total").value
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        for _ in range(users):
+            pool.submit(worker)
+    elapsed = time.perf_counter() - started
+    gateway.close()
+
+    return {
+        "users": users,
+        "requests": users * requests_per_user,
+        "max_concurrent": max_concurrent,
+        "completed": len(results),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "retries": METRICS.counter("llm_retries_total").value - retries_before,
+        "elapsed_seconds": elapsed,
+        "requests_per_sec": len(results) / elapsed if elapsed else 0.0,
+        "ttft": _percentiles(r[0] for r in results),
+        "total": _percentiles(r[1] for r in results),
+        "queue_wait": METRICS.histogram("llm_queue_wait_seconds").snapshot(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Đo tải cổng gọi LLM với server giả lập.")
+    parser.add_argument("--base-url", default=None)
+    parser.add_argument("--port", type=int, default=8008)
+    parser.add_argument("--users", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=4)
+    parser.add_argument("--max-concurrent", type=int, default=MAX_CONCURRENT_REQUESTS)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    base_url = args.base_url
+    server = None
+    if base_url is None:
+        server = start_mock_server(args.port, ttft=args.ttft, tokens_per_sec=args.tokens_per_sec,
+                                   error_rate=args.error_rate)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    result = run_load_test(base_url, args.users, args.requests, args.max_concurrent)
+    if server is not None:
+        server.shutdown()
+
+    print("\n=== KẾT QUẢ ĐO TẢI LLM ===")
+    print(f"{result['completed']}/{result['requests']} yêu cầu thành công, {result['errors']} lỗi, "
+          f"{result['retries']:.0f} lần thử lại, {result['requests_per_sec']:.1f} yêu cầu/giây "
+          f"({result['users']} người dùng, tối đa {result['max_concurrent']} yêu cầu cùng lúc)")
+    for name in ("ttft", "total"):
+        values = ", ".join(f"{k[:-3]} {v:.0f} ms" for k, v in result[name].items())
+        print(f"{name.upper()}: {values}")
+    for error in result["error_samples"]:
+        print(f"  Lỗi: {error}")
+
+
+if __name__ == "__main__":
+    main()
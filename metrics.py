@@ -0,0 +1,200 @@
+# Đo thời gian từng bước của pipeline và xuất số liệu (thay cho các dòng print()).
+# - Histogram: phân bố thời gian (theo bucket kiểu Prometheus) + các mẫu gần nhất để tính p50/p95
+# - Counter: bộ đếm cộng dồn (số câu hỏi, token vào/ra, cache trúng/trượt...)
+# - REGISTRY: một registry dùng chung cho cả tiến trình (mọi phiên chat, luồng nền)
+# Xuất số liệu qua:
+#   - HTTP endpoint dạng text của Prometheus (start_http_server -> http://localhost:<port>/metrics)
+#   - File JSONL (set_jsonl_sink): mỗi sự kiện (vd. một lượt hỏi) là một dòng JSON; file vượt
+#     JSONL_MAX_BYTES thì được xoay vòng (metrics.jsonl -> metrics.jsonl.1 -> ...), giữ JSONL_BACKUPS bản cũ
+
+import os
+import json
+import time
+import threading
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Bucket (giây) cho thời gian: từ 0.5 ms đến 60 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RECENT_SAMPLES = 2048 # <-- Số mẫu gần nhất giữ lại để tính phân vị (p50/p95/p99)
+JSONL_MAX_BYTES = 10 * 1024 * 1024 # <-- Dung lượng tối đa của file JSONL trước khi xoay vòng
+JSONL_BACKUPS = 3 # <-- Số file JSONL cũ giữ lại (.1 là mới nhất)
+
+
+class Histogram:
+    def __init__(self, name, help_text="", buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1) # Ô cuối là +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._recent = deque(maxlen=RECENT_SAMPLES)
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self._counts[bisect_left(self.buckets, value)] += 1
+            self._sum += value
+            self._count += 1
+            self._recent.append(value)
+
+    def percentile(self, q):
+        """Phân vị q (0..100) trên các mẫu gần nhất; None nếu chưa có mẫu."""
+        with self._lock:
+            samples = sorted(self._recent)
+        if not samples:
+            return None
+        index = min(int(round(q / 100 * (len(samples) - 1))), len(samples) - 1)
+        return samples[index]
+
+    def snapshot(self):
+        with self._lock:
+            count, total = self._count, self._sum
+        return {
+            "count": count,
+            "sum": total,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+    def prometheus_lines(self):
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {count}')
+        lines.append(f"{self.name}_sum {total}")
+        lines.append(f"{self.name}_count {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text=""):
+        self.name = name
+        self.help_text = help_text
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+    def prometheus_lines(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter",
+                f"{self.name} {self._value}"]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._jsonl_path = None
+        self._jsonl_max_bytes = JSONL_MAX_BYTES
+        self._jsonl_backups = JSONL_BACKUPS
+        self._jsonl_lock = threading.Lock()
+
+    def _get(self, cls, name, help_text):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.setdefault(name, cls(name, help_text))
+        return metric
+
+    def histogram(self, name, help_text=""):
+        return self._get(Histogram, name, help_text)
+
+    def counter(self, name, help_text=""):
+        return self._get(Counter, name, help_text)
+
+    @contextmanager
+    def timer(self, name, help_text=""):
+        """with REGISTRY.timer("ten_buoc_seconds"): ... -> ghi thời gian chạy vào histogram."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.histogram(name, help_text).observe(time.perf_counter() - start)
+
+    def snapshot(self):
+        """dict {tên: số liệu} của mọi histogram/counter (dùng cho giao diện admin)."""
+        result = {}
+        for name, metric in sorted(self._metrics.items()):
+            result[name] = metric.snapshot() if isinstance(metric, Histogram) else metric.value
+        return result
+
+    def to_prometheus(self):
+        lines = []
+        for _, metric in sorted(self._metrics.items()):
+            lines.extend(metric.prometheus_lines())
+        return "\n".join(lines) + "\n"
+
+    # --- Sự kiện có cấu trúc (JSONL) ---
+    def set_jsonl_sink(self, path, max_bytes=JSONL_MAX_BYTES, backups=JSONL_BACKUPS):
+        """Ghi mỗi sự kiện thành một dòng JSON vào file path (None = tắt), xoay vòng khi vượt max_bytes."""
+        self._jsonl_path = path
+        self._jsonl_max_bytes = max_bytes
+        self._jsonl_backups = backups
+
+    def _rotate_jsonl(self):
+        """path.(n-1) -> path.n, ..., path -> path.1 (bản cũ nhất bị ghi đè). Gọi khi đang giữ _jsonl_lock."""
+        path = self._jsonl_path
+        for i in range(self._jsonl_backups - 1, 0, -1):
+            if os.path.exists(f"{path}.{i}"):
+                os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+        if self._jsonl_backups > 0:
+            os.replace(path, f"{path}.1")
+        else:
+            os.remove(path)
+
+    def event(self, name, **fields):
+        if not self._jsonl_path:
+            return
+        record = {"ts": time.time(), "event": name, **fields}
+        try:
+            with self._jsonl_lock:
+                if (self._jsonl_max_bytes and os.path.exists(self._jsonl_path)
+                        and os.path.getsize(self._jsonl_path) >= self._jsonl_max_bytes):
+                    self._rotate_jsonl()
+                with open(self._jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            print(f"Không ghi được số liệu ra {self._jsonl_path}: {e}")
+
+
+REGISTRY = MetricsRegistry()
+
+
+def start_http_server(port, registry=REGISTRY, host="127.0.0.1"):
+    """Mở endpoint http://host:port/metrics (định dạng text của Prometheus) ở luồng nền."""
+
+    class _MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass # Không in log mỗi lần Prometheus lấy số liệu
+
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,155 @@
+# Server GIẢ LẬP API Groq/OpenAI (chat completions) để chạy thử và kiểm tra tải KHÔNG cần mạng.
+# Trả về câu trả lời soạn sẵn, stream từng token theo chuẩn SSE ("data: {...}" ... "data: [DONE]").
+# Chạy bằng lệnh: python mock_llm_server.py --port 8008
+#   --ttft 0.3            thời gian chờ trước token đầu tiên (giây)
+#   --tokens-per-sec 200  tốc độ stream
+#   --error-rate 0.1      tỉ lệ yêu cầu trả về lỗi 429 (để thử cơ chế thử lại)
+# Rồi chạy app với: GROQ_BASE_URL=http://127.0.0.1:8008 streamlit run chatbot.py
+# Hoặc đo tải: python llm_loadtest.py --base-url http://127.0.0.1:8008
+
+import re
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_ANSWER = (
+    "Chào em! Đây là câu trả lời **giả lập** từ server thử nghiệm. "
+    "Trong lập trình, biến là một vùng nhớ được đặt tên để lưu trữ dữ liệu. "
+    "Em có thể gán giá trị cho biến, đọc lại và thay đổi nó trong quá trình chạy chương trình.\n\n"
+    "- Bước 1: Khai báo biến\n- Bước 2: Gán giá trị\n- Bước 3: Sử dụng biến\n\n"
+    "Em thử tự viết một ví dụ nhỏ nhé?"
+)
+COMPLETION_PATHS = ("/openai/v1/chat/completions", "/v1/chat/completions", "/chat/completions")
+_TOKEN_RE = re.compile(r"\s*\S+")
+
+
+def split_tokens(text):
+    """Chia câu trả lời thành các "token" như Llama trên Groq: từ kèm khoảng trắng phía TRƯỚC (" từ")."""
+    tokens = _TOKEN_RE.findall(text)
+    tail = text[len("".join(tokens)):]
+    if tail: # Khoảng trắng ở cuối câu trả lời
+        tokens.append(tail)
+    return tokens
+
+
+def make_handler(answer=CANNED_ANSWER, ttft=0.2, tokens_per_sec=200.0, error_rate=0.0):
+    tokens = split_tokens(answer)
+
+    class _MockHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1" # Giữ kết nối keep-alive như API thật
+
+        def _send_json(self, status, payload, headers=()):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                request = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                request = {}
+            if self.path.split("?")[0] not in COMPLETION_PATHS:
+                self._send_json(404, {"error": {"message": f"Không có đường dẫn {self.path}"}})
+                return
+            if random.random() < error_rate:
+                self._send_json(429, {"error": {"message": "Rate limit (giả lập)", "type": "rate_limit"}},
+                                headers=[("Retry-After", "0")])
+                return
+
+            model = request.get("model", "mock-model")
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            created = int(time.time())
+            prompt_tokens = sum(len(str(m.get("content", ""))) for m in request.get("messages", [])) // 4
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                     "total_tokens": prompt_tokens + len(tokens)}
+
+            time.sleep(ttft)
+            if not request.get("stream"):
+                self._send_json(200, {
+                    "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": answer}}],
+                    "usage": usage,
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close") # Stream không có Content-Length -> đóng để báo kết thúc
+            self.end_headers()
+            interval = 1.0 / tokens_per_sec if tokens_per_sec > 0 else 0.0
+            try:
+                for i, token in enumerate(tokens):
+                    delta = {"role": "assistant", "content": token} if i == 0 else {"content": token}
+                    self._send_event({"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                                      "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+                    if interval:
+                        time.sleep(interval)
+                # Mẩu cuối: finish_reason và số token (Groq gửi trong x_groq.usage)
+                self._send_event({"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                                  "model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                                  "x_groq": {"id": completion_id, "usage": usage}})
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass # Client hủy stream giữa chừng
+            self.close_connection = True
+
+        def _send_event(self, payload):
+            self.wfile.write(b"data: " + json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n\n")
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path.split("?")[0].endswith("/models"):
+                self._send_json(200, {"object": "list", "data": [{"id": "mock-model", "object": "model"}]})
+            else:
+                self._send_json(404, {"error": {"message": "Not found"}})
+
+        def log_message(self, format, *args):
+            pass
+
+    return _MockHandler
+
+
+def start_mock_server(port=8008, host="127.0.0.1", **options):
+    """Chạy server giả lập ở luồng nền (dùng trong kịch bản đo tải); trả về đối tượng server."""
+    server = ThreadingHTTPServer((host, port), make_handler(**options))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-llm", daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Server giả lập API chat completions của Groq/OpenAI.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8008)
+    parser.add_argument("--ttft", type=float, default=0.2, help="giây chờ trước token đầu tiên")
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="tỉ lệ trả về lỗi 429")
+    args = parser.parse_args(argv)
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(
+        ttft=args.ttft, tokens_per_sec=args.tokens_per_sec, error_rate=args.error_rate))
+    server.daemon_threads = True
+    print(f"Server giả lập đang chạy tại http://{args.host}:{args.port} (Ctrl+C để dừng)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+# Đọc PDF song song theo TRANG bằng nhiều tiến trình (process pool).
+# - Mỗi tác vụ đọc một dải trang liên tiếp của một file (PAGES_PER_TASK trang).
+# - Kết quả được lấy ra ĐÚNG THỨ TỰ (file -> trang) nên chunk luôn giống nhau giữa các lần chạy.
+# - Trang được đẩy thẳng vào StreamingTextSplitter, không ghép thành raw_text của cả cuốn sách.
+# - Mỗi file có thống kê thời gian và lỗi riêng (PdfExtractResult).
+
+import os
+import time
+import bisect
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+PAGES_PER_TASK = 8 # <-- Số trang mỗi tác vụ (nhỏ quá thì tốn công mở file, lớn quá thì chia việc không đều)
+
+
+class PdfExtractResult:
+    """
+    Kết quả đọc một file PDF.
+    - chunks: list chunk theo đúng thứ tự trang
+    - pages: list (trang đầu, trang cuối) của từng chunk, song song với chunks
+    - num_pages: số trang của file
+    - wall_time: thời gian (giây) từ lúc bắt đầu đến khi file này xong
+    - worker_time: tổng thời gian các tiến trình con dùng để đọc trang của file
+    - error: chuỗi mô tả lỗi, hoặc None nếu đọc thành công
+    """
+
+    def __init__(self, pdf_path, chunks, pages, num_pages, wall_time, worker_time, error=None):
+        self.pdf_path = pdf_path
+        self.chunks = chunks
+        self.pages = pages
+        self.num_pages = num_pages
+        self.wall_time = wall_time
+        self.worker_time = worker_time
+        self.error = error
+
+
+class StreamingTextSplitter:
+    """
+    Chia nhỏ văn bản được đưa vào TỪNG PHẦN (từng trang) bằng RecursiveCharacterTextSplitter.
+    Chỉ giữ trong bộ đệm phần văn bản chưa chắc chắn (chunk cuối), nên bộ nhớ không
+    phụ thuộc độ dài cuốn sách.
+    Mỗi chunk trả về kèm trang đầu/trang cuối mà nó nằm trên (đánh số từ 1).
+    """
+
+    def __init__(self, chunk_size, chunk_overlap, flush_factor=4):
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+        self._splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=len
+        )
+        self._flush_size = chunk_size * flush_factor
+        self._parts = []
+        self._buffered = 0
+        self._page_starts = [] # Vị trí (trong bộ đệm) bắt đầu mỗi trang
+        self._page_numbers = [] # Số trang tương ứng
+
+    def feed(self, text, page_number):
+        """Thêm văn bản của một trang; trả về list (chunk, trang đầu, trang cuối) đã hoàn chỉnh."""
+        if not text:
+            return []
+        self._page_starts.append(self._buffered)
+        self._page_numbers.append(page_number)
+        self._parts.append(text)
+        self._buffered += len(text)
+        if self._buffered < self._flush_size:
+            return []
+        return self._split(keep_tail=True)
+
+    def finish(self):
+        """Chia nốt phần còn lại trong bộ đệm."""
+        return self._split(keep_tail=False)
+
+    def _page_at(self, offset):
+        return self._page_numbers[max(bisect.bisect_right(self._page_starts, offset) - 1, 0)]
+
+    def _split(self, keep_tail):
+        text = "".join(self._parts)
+        chunks = self._splitter.split_text(text) if text else []
+        located = []
+        search_from = 0
+        for chunk in chunks:
+            # Chunk là một đoạn con của text (đã bỏ khoảng trắng 2 đầu) -> tìm vị trí để biết trang
+            pos = text.find(chunk, search_from)
+            if pos < 0:
+                pos = search_from
+            located.append((chunk, pos))
+            search_from = pos + 1
+
+        result = [(c, self._page_at(p), self._page_at(p + len(c) - 1)) for c, p in located]
+        if keep_tail and result:
+            # Chunk cuối có thể còn nối tiếp với trang sau -> giữ lại trong bộ đệm
+            result.pop()
+            _, tail_pos = located[-1]
+            keep = [i for i, start in enumerate(self._page_starts) if start > tail_pos]
+            self._page_numbers = [self._page_at(tail_pos)] + [self._page_numbers[i] for i in keep]
+            self._page_starts = [0] + [self._page_starts[i] - tail_pos for i in keep]
+            self._parts = [text[tail_pos:]]
+            self._buffered = len(text) - tail_pos
+        else:
+            self._parts, self._buffered, self._page_starts, self._page_numbers = [], 0, [], []
+        return result
+
+
+def _count_pages(pdf_path):
+    from pypdf import PdfReader
+
+    return len(PdfReader(pdf_path).pages)
+
+
+def _extract_page_range(pdf_path, start, stop):
+    """Chạy trong tiến trình con: đọc text các trang [start, stop) của một file."""
+    from pypdf import PdfReader
+
+    t0 = time.perf_counter()
+    reader = PdfReader(pdf_path)
+    pages = [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+    return pages, time.perf_counter() - t0
+
+
+class _InlineFuture:
+    """Thay cho Future khi chạy 1 tiến trình: chỉ đọc trang khi cần lấy kết quả."""
+
+    def __init__(self, fn, *args):
+        self._fn = fn
+        self._args = args
+
+    def result(self):
+        return self._fn(*self._args)
+
+
+def _default_workers():
+    return max(1, (os.cpu_count() or 1) - 1)
+
+
+def extract_pdfs(pdf_paths, chunk_size, chunk_overlap, max_workers=None, pages_per_task=PAGES_PER_TASK):
+    """
+    Đọc và chia nhỏ nhiều file PDF, song song theo trang.
+    Generator: trả về PdfExtractResult cho từng file theo đúng thứ tự pdf_paths,
+    ngay khi file đó đọc xong (không chờ các file sau).
+    """
+    max_workers = max_workers or _default_workers()
+    start = time.perf_counter()
+
+    # 1. Đếm số trang để chia tác vụ (lỗi ở bước này = file hỏng)
+    plans = []
+    for pdf_path in pdf_paths:
+        try:
+            plans.append((pdf_path, _count_pages(pdf_path), None))
+        except Exception as e:
+            plans.append((pdf_path, 0, f"{type(e).__name__}: {e}"))
+
+    total_pages = sum(num_pages for _, num_pages, _ in plans)
+    executor = None
+    if max_workers > 1 and total_pages > pages_per_task:
+        # "spawn" an toàn hơn "fork" khi tiến trình cha có nhiều luồng (vd. server Streamlit)
+        executor = ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+    print(f"Đọc {len(pdf_paths)} file PDF ({total_pages} trang) với {max_workers if executor else 1} tiến trình...")
+
+    try:
+        # 2. Gửi tất cả tác vụ trước để các tiến trình con luôn có việc
+        submit = executor.submit if executor else _InlineFuture
+        file_tasks = []
+        for pdf_path, num_pages, error in plans:
+            futures = [] if error else [
+                submit(_extract_page_range, pdf_path, s, min(s + pages_per_task, num_pages))
+                for s in range(0, num_pages, pages_per_task)
+            ]
+            file_tasks.append((pdf_path, num_pages, error, futures))
+
+        # 3. Lấy kết quả theo thứ tự và đẩy từng trang vào bộ chia nhỏ
+        for pdf_path, num_pages, error, futures in file_tasks:
+            located = []
+            worker_time = 0.0
+            if error is None:
+                splitter = StreamingTextSplitter(chunk_size, chunk_overlap)
+                page_number = 0
+                try:
+                    for future in futures:
+                        pages, elapsed = future.result()
+                        worker_time += elapsed
+                        for page_text in pages:
+                            page_number += 1
+                            located.extend(splitter.feed(page_text, page_number))
+                    located.extend(splitter.finish())
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                    located = []
+                    for future in futures:
+                        if hasattr(future, "cancel"):
+                            future.cancel()
+            yield PdfExtractResult(
+                pdf_path, [c for c, _, _ in located], [(first, last) for _, first, last in located], num_pages, time.perf_counter() - start, worker_time, error
+            )
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
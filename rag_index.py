@@ -0,0 +1,522 @@
+# Lõi RAG: đọc PDF "sổ tay", chia nhỏ, lập chỉ mục BM25 và LƯU chỉ mục xuống đĩa.
+# Module này KHÔNG dùng Streamlit để có thể gọi lại từ nơi khác (chatbot.py, script...).
+# RagIndexHolder giữ chỉ mục dùng chung cho mọi phiên và tự dựng lại ở luồng nền.
+#
+# Chỉ mục được lưu trong thư mục INDEX_DIR:
+#   - chunks/<sha256>_<chunk_size>_<chunk_overlap>_v<định dạng chunk>.json : các chunk của TỪNG file PDF
+#     (khóa theo nội dung file => file không đổi thì không phải đọc lại PDF)
+#   - index.pkl : chỉ mục ngược BM25 (từ vựng + posting, xem bm25_search.py),
+#     kèm "dấu vân tay" (fingerprint) của toàn bộ thư mục PDF + tham số chia nhỏ.
+#   - store/<fingerprint>/ : nội dung chunk + nguồn (file, trang), mmap chỉ-đọc (xem chunk_store.py)
+#   - store/<fingerprint>/dense/ : chỉ mục LSA + IVF cho tìm kiếm kết hợp (xem dense_index.py)
+
+import os
+import glob
+import json
+import time
+import pickle
+import hashlib
+import threading
+
+import numpy as np
+
+from bm25_search import BM25Index
+from pdf_ingest import extract_pdfs
+from chunk_select import normalize_rows
+from dense_index import DenseIndex, DENSE_MIN_SIMILARITY, HYBRID_LEXICAL_WEIGHT, RRF_K, reciprocal_rank_fusion
+from chunk_store import ChunkStore, store_path, write_chunk_store, remove_stale_stores
+from metrics import REGISTRY
+
+INDEX_DIR = "./.rag_cache"
+CHUNK_SIZE = 1200
+CHUNK_OVERLAP = 150
+INDEX_FORMAT_VERSION = 6 # <-- Tăng số này khi đổi định dạng file chỉ mục
+CHUNK_CACHE_VERSION = 3 # <-- Tăng số này khi đổi cách đọc/chia nhỏ PDF
+
+
+class RagIndex:
+    """
+    Gói các thành phần RAG đã lập chỉ mục.
+    - bm25: BM25Index lập trên các chunk
+    - chunk_store: ChunkStore chứa nội dung + nguồn của các chunk (theo thứ tự file -> trang)
+    - all_chunks: chính chunk_store (dùng như list nội dung chunk)
+    - chunk_sources: dãy (tên file PDF, trang đầu, trang cuối) song song với all_chunks
+    - files: dict {tên file PDF: sha256 nội dung}
+    - failed_files: list tên file PDF đọc bị lỗi (để giao diện báo cho người dùng)
+    - fingerprint: khóa của chỉ mục (nội dung PDF + tham số chia nhỏ)
+    - doc_vectors: vector từ (điểm BM25, chuẩn hóa L2) của từng chunk, dạng CSR; chỉ tạo khi
+      cần đo độ trùng lặp giữa các chunk (xem chunk_select.py)
+    - dense: DenseIndex (LSA + IVF) cho hybrid_search, hoặc None
+    - precomputed: dict {câu hỏi: kết quả} do ứng dụng tính sẵn trước khi chỉ mục được đưa vào dùng
+      (xem tham số prepare của RagIndexHolder), vd. bối cảnh RAG của các nút gợi ý
+    """
+
+    def __init__(self, bm25, chunk_store, files, fingerprint, failed_files=None, dense=None):
+        self.bm25 = bm25
+        self.chunk_store = chunk_store
+        self.all_chunks = chunk_store
+        self.chunk_sources = chunk_store.sources
+        self.files = files
+        self.fingerprint = fingerprint
+        self.failed_files = failed_files or []
+        self.dense = dense
+        self._doc_vectors = None
+        self._prefetched = {} # câu hỏi -> (doc_ids, scores, điểm tối đa), xem prefetch()
+        self._prefetched_hybrid = {} # (câu hỏi, ngưỡng BM25) -> (doc_ids, điểm RRF)
+        self._prefetch_k = 0
+        self.precomputed = {}
+
+    @property
+    def doc_vectors(self):
+        if self._doc_vectors is None: # Tạo hai lần cùng lúc cũng không sao (kết quả như nhau)
+            self._doc_vectors = normalize_rows(self.bm25.postings)
+        return self._doc_vectors
+
+    def search(self, query, k=10):
+        """Tìm k chunk điểm BM25 cao nhất. Trả về (doc_ids, scores)."""
+        hit = self._prefetched.get(query)
+        if hit is not None and k <= self._prefetch_k:
+            REGISTRY.counter("rag_prefetch_hits_total", "Số lần dùng kết quả tìm kiếm đã tính trước").inc()
+            return hit[0][:k], hit[1][:k]
+        return self.bm25.search(query, k)
+
+    def dense_search(self, query, k=10, term_ids=None):
+        """Tìm k chunk gần nhất trong không gian LSA. Trả về (doc_ids, cosine). term_ids: query_terms đã tách sẵn."""
+        if term_ids is None:
+            term_ids = self.bm25.query_terms(query)
+        if self.dense is None or term_ids.size == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return self.dense.search(term_ids, self.bm25.idf[term_ids], k)
+
+    def hybrid_search(self, query, k=10, min_relative_score=0.0, min_similarity=DENSE_MIN_SIMILARITY):
+        """
+        Kết hợp BM25 và LSA bằng Reciprocal Rank Fusion (BM25 trọng số HYBRID_LEXICAL_WEIGHT).
+        Mỗi bên tự lọc ứng viên theo ngưỡng của mình (BM25: tỉ lệ so với điểm tối đa của câu hỏi;
+        LSA: cosine), nên chunk bị BM25 loại (vd. câu hỏi diễn đạt khác sách) vẫn có thể vào nhờ LSA.
+        Trả về (doc_ids, điểm RRF) giảm dần, tối đa k chunk. Câu hỏi được tách từ MỘT lần cho cả hai bên.
+        """
+        hit = self._prefetched_hybrid.get((query, min_relative_score))
+        if hit is not None and k <= self._prefetch_k and min_similarity == DENSE_MIN_SIMILARITY:
+            REGISTRY.counter("rag_prefetch_hits_total", "Số lần dùng kết quả tìm kiếm đã tính trước").inc()
+            return hit[0][:k], hit[1][:k]
+        with REGISTRY.timer("rag_hybrid_search_seconds", "Thời gian tìm kiếm kết hợp BM25 + LSA"):
+            lexical_hit = self._prefetched.get(query)
+            if lexical_hit is not None and k <= self._prefetch_k:
+                term_ids = None
+                doc_ids, scores, max_score = lexical_hit[0][:k], lexical_hit[1][:k], lexical_hit[2]
+            else:
+                term_ids = self.bm25.query_terms(query)
+                doc_ids, scores = self.bm25.search_terms(term_ids, k)
+                max_score = self.bm25.max_score_of_terms(term_ids)
+            lexical = [i for i, s in zip(doc_ids, scores) if max_score > 0 and s / max_score >= min_relative_score]
+            dense_ids, similarities = self.dense_search(query, k, term_ids=term_ids)
+            dense = dense_ids[similarities >= min_similarity]
+            fused_ids, fused_scores = reciprocal_rank_fusion([lexical, dense], RRF_K, [HYBRID_LEXICAL_WEIGHT, 1.0])
+            return fused_ids[:k], fused_scores[:k]
+
+    def search_batch(self, queries, k=10):
+        """Tìm kiếm nhiều câu hỏi cùng lúc (xem BM25Index.search_batch). Trả về list (doc_ids, scores)."""
+        return self.bm25.search_batch(queries, k)
+
+    def max_possible_score(self, query):
+        """Cận trên điểm BM25 của câu hỏi (xem BM25Index.max_possible_score)."""
+        hit = self._prefetched.get(query)
+        return hit[2] if hit is not None else self.bm25.max_possible_score(query)
+
+    def prefetch(self, queries, k, hybrid_min_relative_score=None):
+        """
+        Tính trước kết quả tìm kiếm cho các câu hỏi biết trước (vd. nút gợi ý ở màn hình chào)
+        bằng MỘT lần search_batch; search() với đúng câu hỏi đó sẽ không phải chấm điểm lại.
+        hybrid_min_relative_score khác None (và có chỉ mục LSA): tính trước cả ứng viên gộp của
+        hybrid_search(q, k, hybrid_min_relative_score).
+        Gọi trước khi chỉ mục được đưa vào dùng (RagIndexHolder làm việc này).
+        """
+        queries = list(dict.fromkeys(queries))
+        results = self.search_batch(queries, k)
+        self._prefetch_k = k
+        self._prefetched = {
+            q: (doc_ids, scores, self.bm25.max_possible_score(q)) for q, (doc_ids, scores) in zip(queries, results)
+        }
+        if hybrid_min_relative_score is not None and self.dense is not None:
+            self._prefetched_hybrid = {
+                (q, hybrid_min_relative_score): self.hybrid_search(q, k, hybrid_min_relative_score) for q in queries
+            }
+        self.doc_vectors # Tạo sẵn vector chunk cho bước chọn chunk (chunk_select.py)
+
+    def citation(self, doc_id):
+        """Nguồn của chunk, vd. "VT12_GiaoTrinh_LyThuyet_Excel.pdf, tr. 34"."""
+        return self.chunk_store.citation(doc_id)
+
+
+def list_pdf_files(pdf_directory):
+    """Danh sách file PDF trong thư mục, sắp xếp theo tên để thứ tự chunk luôn cố định."""
+    return sorted(glob.glob(os.path.join(pdf_directory, "*.pdf")))
+
+
+def file_sha256(path, block_size=1 << 20):
+    """Tính sha256 nội dung file (đọc theo khối để không tốn RAM)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def compute_fingerprint(files, chunk_size, chunk_overlap):
+    """
+    Khóa của toàn bộ chỉ mục: phụ thuộc vào nội dung từng PDF, tham số chia nhỏ,
+    định dạng chỉ mục và phiên bản numpy/scipy (vì mảng và ma trận thưa được pickle).
+    """
+    import numpy
+    import scipy
+
+    payload = json.dumps({
+        "files": sorted(files.items()),
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "format": INDEX_FORMAT_VERSION,
+        "numpy": numpy.__version__,
+        "scipy": scipy.__version__,
+    }, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _atomic_write_bytes(path, data):
+    """Ghi ra file tạm rồi os.replace, để tiến trình khác không bao giờ đọc phải file ghi dở."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _chunk_cache_path(cache_dir, sha, chunk_size, chunk_overlap):
+    return os.path.join(cache_dir, "chunks", f"{sha}_{chunk_size}_{chunk_overlap}_v{CHUNK_CACHE_VERSION}.json")
+
+
+def _read_cached_chunks(cache_path):
+    """Đọc (chunks, pages) đã lưu của một PDF; trả về None nếu chưa có hoặc cache hỏng."""
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        return saved["chunks"], [tuple(p) for p in saved["pages"]]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _remove_stale_chunk_caches(cache_dir, files, chunk_size, chunk_overlap):
+    """Xóa cache chunk không còn dùng (PDF đã sửa/xóa, tham số hoặc CHUNK_CACHE_VERSION cũ); lỗi thì bỏ qua."""
+    keep = {os.path.basename(_chunk_cache_path(cache_dir, sha, chunk_size, chunk_overlap)) for sha in files.values()}
+    chunk_dir = os.path.join(cache_dir, "chunks")
+    try:
+        names = os.listdir(chunk_dir)
+    except OSError:
+        return
+    for name in names:
+        if name not in keep and not name.endswith(".tmp"): # .tmp: tiến trình khác đang ghi dở
+            try:
+                os.remove(os.path.join(chunk_dir, name))
+            except OSError:
+                pass
+
+
+def _write_cached_chunks(cache_path, chunks, pages):
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        payload = {"chunks": chunks, "pages": pages}
+        _atomic_write_bytes(cache_path, json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+    except OSError as e:
+        print(f"Không ghi được cache chunk {cache_path}: {e}")
+
+
+def _build_dense_index(bm25):
+    """Dựng chỉ mục LSA; lỗi thì chỉ tắt tìm kiếm dense, không ảnh hưởng BM25."""
+    start = time.perf_counter()
+    try:
+        dense = DenseIndex.build(bm25)
+    except Exception as e:
+        print(f"Không dựng được chỉ mục LSA: {e}")
+        return None
+    REGISTRY.histogram("rag_dense_build_seconds", "Thời gian dựng chỉ mục LSA + IVF").observe(time.perf_counter() - start)
+    return dense
+
+
+def _open_dense_index(bm25, cache_dir, fingerprint):
+    """Mở chỉ mục LSA đã lưu của fingerprint; chưa có (vd. lần trước không bật) thì dựng từ bm25 rồi lưu."""
+    dense_path = os.path.join(store_path(cache_dir, fingerprint), "dense")
+    dense = DenseIndex.open(dense_path)
+    if dense is not None:
+        return dense
+    dense = _build_dense_index(bm25)
+    if dense is not None:
+        try:
+            dense.save(dense_path)
+            dense = DenseIndex.open(dense_path) or dense # Dùng bản mmap (chung giữa các tiến trình)
+        except OSError as e:
+            print(f"Không lưu được chỉ mục LSA xuống đĩa: {e}")
+    return dense
+
+
+def _load_saved_index(index_path, fingerprint, cache_dir, build_dense=False):
+    """Đọc index.pkl và mở kho chunk nếu có và khớp fingerprint, ngược lại trả về None."""
+    try:
+        with open(index_path, "rb") as f:
+            saved = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    if not isinstance(saved, dict) or saved.get("fingerprint") != fingerprint:
+        return None
+    chunk_store = ChunkStore.open(store_path(cache_dir, fingerprint))
+    if chunk_store is None or len(chunk_store) != saved["num_chunks"]:
+        return None
+    dense = _open_dense_index(saved["bm25"], cache_dir, fingerprint) if build_dense else None
+    return RagIndex(saved["bm25"], chunk_store, saved["files"], fingerprint, dense=dense)
+
+
+def load_or_build_index(pdf_directory, cache_dir=INDEX_DIR,
+                        chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, max_workers=None, build_dense=False):
+    """
+    Tải chỉ mục RAG từ đĩa nếu nội dung PDF và tham số chia nhỏ không đổi.
+    Nếu có PDF mới/đã sửa: chỉ đọc lại các file đó, ghép với chunk đã lưu của
+    các file còn lại, rồi lập lại chỉ mục BM25 (nhanh, vì không phải đọc PDF).
+    Các PDF cần đọc được đọc song song theo trang (xem pdf_ingest.py); max_workers=None
+    nghĩa là dùng (số CPU - 1) tiến trình.
+    build_dense=True: dựng/mở thêm chỉ mục LSA (rag_index.dense) cho hybrid_search; mặc định bỏ qua
+    (SVD + k-means tốn thời gian và chỉ cần khi bật tìm kiếm kết hợp).
+    Trả về: RagIndex, hoặc None nếu không có PDF / không trích xuất được nội dung.
+    """
+    start = time.perf_counter()
+    pdf_files = list_pdf_files(pdf_directory)
+    if not pdf_files:
+        print(f"!!! CẢNH BÁO RAG: Không tìm thấy file PDF nào trong thư mục '{pdf_directory}'.")
+        return None
+
+    # 1. Tính fingerprint từ nội dung các file PDF
+    files = {os.path.basename(p): file_sha256(p) for p in pdf_files}
+    fingerprint = compute_fingerprint(files, chunk_size, chunk_overlap)
+    index_path = os.path.join(cache_dir, "index.pkl")
+
+    # 2. Chỉ mục đã lưu còn hợp lệ -> chỉ cần tải lên
+    rag_index = _load_saved_index(index_path, fingerprint, cache_dir, build_dense)
+    if rag_index is not None:
+        REGISTRY.histogram("rag_index_load_seconds", "Thời gian tải chỉ mục RAG đã lưu").observe(
+            time.perf_counter() - start
+        )
+        print(f"--- ĐÃ TẢI CHỈ MỤC RAG TỪ ĐĨA ({len(rag_index.all_chunks)} chunks, "
+              f"{time.perf_counter() - start:.2f}s) ---")
+        return rag_index
+
+    # 3. Ghép chunk: dùng lại cache của file không đổi, chỉ đọc PDF mới/đã sửa
+    print(f"Tìm thấy {len(pdf_files)} file PDF. Đang xử lý...")
+    chunks_by_file = {}
+    to_extract = []
+    for pdf_path in pdf_files:
+        name = os.path.basename(pdf_path)
+        cached = _read_cached_chunks(_chunk_cache_path(cache_dir, files[name], chunk_size, chunk_overlap))
+        if cached is None:
+            to_extract.append(pdf_path)
+        else:
+            chunks_by_file[name] = cached
+            print(f"Dùng lại chunk đã lưu: {name} ({len(cached[0])} chunks)")
+
+    failed_files = []
+    for result in extract_pdfs(to_extract, chunk_size, chunk_overlap, max_workers):
+        name = os.path.basename(result.pdf_path)
+        if result.error:
+            print(f"Lỗi khi đọc file {result.pdf_path}: {result.error}")
+            failed_files.append(name)
+            continue
+        print(f"Đã xử lý: {name} ({result.num_pages} trang, {len(result.chunks)} chunks, "
+              f"xong sau {result.wall_time:.2f}s, đọc {result.worker_time:.2f}s)")
+        chunks_by_file[name] = (result.chunks, result.pages)
+        _write_cached_chunks(
+            _chunk_cache_path(cache_dir, files[name], chunk_size, chunk_overlap), result.chunks, result.pages
+        )
+
+    all_chunks = []
+    chunk_sources = []
+    for pdf_path in pdf_files:
+        name = os.path.basename(pdf_path)
+        chunks, pages = chunks_by_file.get(name, ([], []))
+        all_chunks.extend(chunks)
+        chunk_sources.extend((name, first, last) for first, last in pages)
+
+    if not all_chunks:
+        print("!!! CẢNH BÁO RAG: Đã đọc file PDF nhưng không trích xuất được nội dung.")
+        return None
+
+    # 4. Lập chỉ mục BM25 trên toàn bộ chunk (IDF phụ thuộc cả kho nên phải lập lại)
+    print(f"Tổng cộng {len(all_chunks)} khối kiến thức. Đang tạo chỉ mục BM25{' + LSA' if build_dense else ''}...")
+    bm25 = BM25Index.build(all_chunks)
+    dense = _build_dense_index(bm25) if build_dense else None
+
+    # 5. Lưu kho chunk + chỉ mục (không lưu nếu có file lỗi, để lần sau thử đọc lại),
+    # rồi dùng kho chunk mmap từ đĩa thay cho list chunk trong RAM
+    chunk_store = None
+    if not failed_files:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            write_chunk_store(store_path(cache_dir, fingerprint), all_chunks, chunk_sources)
+            if dense is not None:
+                dense_path = os.path.join(store_path(cache_dir, fingerprint), "dense")
+                dense.save(dense_path)
+                dense = DenseIndex.open(dense_path) or dense # Dùng bản mmap (chung giữa các tiến trình)
+            _atomic_write_bytes(index_path, pickle.dumps({
+                "fingerprint": fingerprint,
+                "files": files,
+                "bm25": bm25,
+                "num_chunks": len(all_chunks),
+            }, protocol=pickle.HIGHEST_PROTOCOL))
+            remove_stale_stores(cache_dir, fingerprint)
+            _remove_stale_chunk_caches(cache_dir, files, chunk_size, chunk_overlap)
+            chunk_store = ChunkStore.open(store_path(cache_dir, fingerprint))
+        except OSError as e:
+            print(f"Không lưu được chỉ mục RAG xuống đĩa: {e}")
+    if chunk_store is None:
+        chunk_store = ChunkStore.from_lists(all_chunks, chunk_sources)
+    rag_index = RagIndex(bm25, chunk_store, files, fingerprint, failed_files, dense=dense)
+
+    REGISTRY.histogram("rag_index_build_seconds", "Thời gian dựng chỉ mục RAG (đọc PDF + BM25)").observe(
+        time.perf_counter() - start
+    )
+    REGISTRY.counter("rag_pdf_failures_total", "Số lần đọc file PDF bị lỗi").inc(len(failed_files))
+    print(f"--- HOÀN TẤT KHỞI TẠO RAG ({time.perf_counter() - start:.2f}s) ---")
+    return rag_index
+
+
+def _directory_signature(pdf_directory):
+    """Tên + kích thước + thời gian sửa của các PDF: đổi là biết thư mục đã thay đổi (rẻ hơn hash)."""
+    signature = []
+    for pdf_path in list_pdf_files(pdf_directory):
+        try:
+            st_ = os.stat(pdf_path)
+            signature.append((os.path.basename(pdf_path), st_.st_size, st_.st_mtime_ns))
+        except OSError:
+            pass # File vừa bị xóa giữa chừng
+    return tuple(signature)
+
+
+class RagIndexHolder:
+    """
+    Giữ chỉ mục RAG hiện hành, dùng chung cho MỌI phiên chat trong tiến trình.
+    - get(): trả về RagIndex hiện tại (hoặc None), không bao giờ phải chờ dựng chỉ mục.
+    - Một luồng nền dựng lại chỉ mục khi thư mục PDF thay đổi trên đĩa hoặc sau
+      refresh_interval giây, rồi thay thế chỉ mục cũ bằng MỘT phép gán (atomic swap).
+      Phiên nào đang dùng chỉ mục cũ vẫn dùng tiếp bản cũ cho đến lượt hỏi sau.
+    - version tăng mỗi lần chỉ mục được thay.
+    - prefetch_queries: các câu hỏi được tính trước kết quả (top prefetch_k) mỗi khi dựng chỉ mục;
+      prefetch_hybrid_min_relative_score khác None thì tính trước cả kết quả hybrid_search.
+    - prepare: hàm prepare(rag_index) gọi với mỗi chỉ mục mới, sau prefetch và TRƯỚC khi thay vào
+      (vd. tính sẵn kết quả cuối cùng vào rag_index.precomputed); lỗi thì chỉ bỏ qua bước này.
+    """
+
+    def __init__(self, pdf_directory, cache_dir=INDEX_DIR, refresh_interval=3600, poll_interval=30,
+                 prefetch_queries=(), prefetch_k=12, prefetch_hybrid_min_relative_score=None,
+                 prepare=None, **build_kwargs):
+        self.pdf_directory = pdf_directory
+        self.cache_dir = cache_dir
+        self.refresh_interval = refresh_interval
+        self.poll_interval = poll_interval
+        self.build_kwargs = build_kwargs
+        self.prefetch_queries = list(prefetch_queries)
+        self.prefetch_k = prefetch_k
+        self.prefetch_hybrid_min_relative_score = prefetch_hybrid_min_relative_score
+        self.prepare = prepare
+        self.version = 0
+        self.last_error = None
+        self._index = None
+        self._signature = None
+        self._last_build = 0.0
+        self._lock = threading.Lock() # Chỉ một lần dựng chỉ mục tại một thời điểm
+        self._ready = threading.Event()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def get(self):
+        return self._index
+
+    def wait_ready(self, timeout=None):
+        """Chờ lần dựng chỉ mục ĐẦU TIÊN xong (dù thành công hay không)."""
+        return self._ready.wait(timeout)
+
+    def start(self):
+        """Khởi động luồng nền (gọi nhiều lần cũng chỉ có một luồng)."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="rag-index-refresh", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def request_refresh(self):
+        """Yêu cầu luồng nền kiểm tra và dựng lại chỉ mục ngay (không chờ)."""
+        self._wakeup.set()
+
+    def refresh(self, force=False):
+        """
+        Dựng lại chỉ mục nếu thư mục PDF đổi (hoặc force=True), rồi thay chỉ mục hiện hành.
+        Chạy trong luồng nền; cũng có thể gọi trực tiếp (vd. trong script).
+        Trả về True nếu chỉ mục đã được thay.
+        """
+        with self._lock:
+            signature = _directory_signature(self.pdf_directory)
+            if not force and self._ready.is_set() and signature == self._signature:
+                return False
+            self._signature = signature
+            try:
+                new_index = load_or_build_index(self.pdf_directory, self.cache_dir, **self.build_kwargs)
+                if new_index is not None and new_index is not self._index:
+                    if self.prefetch_queries:
+                        new_index.prefetch(self.prefetch_queries, self.prefetch_k,
+                                           self.prefetch_hybrid_min_relative_score)
+                    self._prepare(new_index)
+                self.last_error = None
+            except Exception as e:
+                print(f"Lỗi khi dựng lại chỉ mục RAG: {e}")
+                self.last_error = e
+                new_index = self._index # Giữ nguyên bản đang dùng
+            self._last_build = time.monotonic()
+            if new_index is None: # Không có PDF hoặc lỗi: ghi một lần mỗi lần dựng, không phải mỗi lượt chạy
+                REGISTRY.event("rag_index_unavailable", version=self.version,
+                               error=None if self.last_error is None else str(self.last_error))
+
+            swapped = False
+            current = self._index
+            if new_index is not current and not (
+                new_index is not None and current is not None and new_index.fingerprint == current.fingerprint
+            ): # Cùng fingerprint (chỉ đổi mtime) -> giữ nguyên bản cũ
+                self._index = new_index # <-- Atomic swap: các phiên sau sẽ thấy bản mới
+                self.version += 1
+                swapped = True
+                REGISTRY.counter("rag_index_swaps_total", "Số lần thay chỉ mục RAG").inc()
+                REGISTRY.event(
+                    "rag_index_swap",
+                    version=self.version,
+                    chunks=0 if new_index is None else len(new_index.all_chunks),
+                    failed_files=[] if new_index is None else new_index.failed_files,
+                    error=None if self.last_error is None else str(self.last_error),
+                )
+                print(f"--- ĐÃ THAY CHỈ MỤC RAG (phiên bản {self.version}) ---")
+            self._ready.set()
+            return swapped
+
+    def _prepare(self, new_index):
+        if self.prepare is None:
+            return
+        try:
+            self.prepare(new_index)
+        except Exception as e:
+            print(f"Lỗi khi tính sẵn kết quả cho chỉ mục mới: {e}")
+
+    def _run(self):
+        self.refresh(force=True)
+        while not self._stop.is_set():
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            if self._stop.is_set():
+                break
+            expired = time.monotonic() - self._last_build >= self.refresh_interval
+            self.refresh(force=expired)
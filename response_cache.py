@@ -0,0 +1,156 @@
+# Cache câu trả lời của AI cho các câu hỏi lặp lại (vd. các nút gợi ý ở màn hình chào).
+# Khóa cache = hash của ĐÚNG list tin nhắn gửi cho AI (system prompt, tóm tắt + lịch sử chat, bối cảnh
+# RAG/FAQ, câu hỏi) + tên mô hình + fingerprint của chỉ mục PDF. Câu hỏi nối tiếp ("Cho ví dụ khác?")
+# trong hai cuộc trò chuyện khác nhau có lịch sử khác nhau nên không dùng nhầm câu trả lời của nhau;
+# sửa PDF (cùng id chunk nhưng nội dung mới) hay đổi mô hình/vai trò thì câu trả lời cũ tự hết hiệu lực.
+# Câu hỏi hiện tại được chuẩn hóa trước khi hash (chữ thường, gộp khoảng trắng, bỏ dấu câu hai đầu),
+# nên "sự khác nhau giữa ram và rom" vẫn trúng câu trả lời của nút "Sự khác nhau giữa RAM và ROM?".
+# - Trong RAM: LRU (tối đa max_entries mục) + TTL (hết hạn sau ttl giây)
+# - Trên đĩa (tùy chọn): SQLite, để khởi động lại server vẫn còn cache; mục hết hạn bị xóa mỗi lần put()
+# - Câu trả lời lấy từ cache được "phát lại" thành từng mẩu như stream thật.
+
+import re
+import time
+import json
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+_SPACES_RE = re.compile(r"\s+")
+_STREAM_PIECE_RE = re.compile(r"\S+\s*|\s+")
+
+
+def normalize_question(question):
+    """Chuẩn hóa câu hỏi: NFC, chữ thường, gộp khoảng trắng, bỏ dấu câu/ngoặc ở hai đầu."""
+    text = unicodedata.normalize("NFC", question).lower()
+    text = _SPACES_RE.sub(" ", text).strip()
+    return text.strip(" ?!.…,;:'\"“”()")
+
+
+def make_cache_key(messages, model_name, index_fingerprint=None, question=None):
+    """
+    Khóa cache (sha256) từ list tin nhắn gửi cho AI ({"role", "content"}), mô hình và chỉ mục PDF.
+    question: câu hỏi gốc nằm trong tin nhắn CUỐI; được thay bằng normalize_question(question) trước khi hash.
+    """
+    contents = [unicodedata.normalize("NFC", m["content"]) for m in messages]
+    if question and contents:
+        question = unicodedata.normalize("NFC", question)
+        pos = contents[-1].rfind(question)
+        if pos != -1:
+            contents[-1] = contents[-1][:pos] + normalize_question(question) + contents[-1][pos + len(question):]
+    parts = {
+        "messages": [{"role": m["role"], "content": c} for m, c in zip(messages, contents)],
+        "model": model_name,
+        "index": index_fingerprint,
+    }
+    payload = json.dumps(parts, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def replay_stream(text):
+    """Phát lại câu trả lời đã cache thành từng mẩu (mỗi từ + khoảng trắng theo sau)."""
+    for match in _STREAM_PIECE_RE.finditer(text):
+        yield match.group(0)
+
+
+class ResponseCache:
+    """
+    Cache LRU + TTL, an toàn khi nhiều phiên (nhiều luồng) dùng chung.
+    disk_path: đường dẫn file SQLite; None = chỉ cache trong RAM.
+    Bộ đếm hits/misses xem qua stats().
+    """
+
+    def __init__(self, max_entries=512, ttl=24 * 3600, disk_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # key -> (thời điểm tạo, câu trả lời)
+        self._lock = threading.Lock()
+        self._db = None
+        if disk_path:
+            try:
+                self._db = sqlite3.connect(disk_path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS responses "
+                    "(key TEXT PRIMARY KEY, created REAL NOT NULL, response TEXT NOT NULL)"
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"Không mở được cache câu trả lời trên đĩa ({disk_path}): {e}")
+                self._db = None
+
+    def get(self, key):
+        """Trả về câu trả lời đã cache (còn hạn) hoặc None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._db is not None:
+                entry = self._load_from_disk(key)
+                if entry is not None:
+                    self._remember(key, entry)
+            if entry is not None and now - entry[0] > self.ttl:
+                self._forget(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, response):
+        """Lưu câu trả lời (chỉ nên gọi khi stream đã nhận đủ, không lỗi)."""
+        if not response:
+            return
+        entry = (time.time(), response)
+        with self._lock:
+            self._remember(key, entry)
+            if self._db is not None:
+                try:
+                    # Xóa luôn các mục đã hết hạn, để file SQLite không phình mãi
+                    self._db.execute("DELETE FROM responses WHERE created < ?", (entry[0] - self.ttl,))
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO responses (key, created, response) VALUES (?, ?, ?)",
+                        (key, entry[0], response)
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    print(f"Không ghi được cache câu trả lời xuống đĩa: {e}")
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    # --- Các hàm nội bộ (gọi khi đang giữ self._lock) ---
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False) # Bỏ mục lâu không dùng nhất (LRU)
+
+    def _forget(self, key):
+        self._entries.pop(key, None)
+        if self._db is not None:
+            try:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+            except sqlite3.Error:
+                pass
+
+    def _load_from_disk(self, key):
+        try:
+            row = self._db.execute(
+                "SELECT created, response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        return (row[0], row[1]) if row else None
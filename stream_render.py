@@ -0,0 +1,83 @@
+# Hiển thị câu trả lời dạng stream mà không vẽ lại sau MỖI mẩu (delta).
+# Mỗi lần placeholder.markdown(...) phải gửi lại TOÀN BỘ câu trả lời, nên vẽ lại sau
+# từng delta là O(n²) với câu trả lời dài. StreamRenderer gom các delta lại và chỉ vẽ:
+#   - tối đa max_fps lần mỗi giây, và ưu tiên lúc văn bản dừng ở ranh giới "an toàn"
+#     cho markdown (khoảng trắng / xuống dòng) để không nhấp nháy chữ in đậm, bảng...
+#     Delta của Groq/Llama thường có khoảng trắng ở ĐẦU (" từ"), nên delta bắt đầu bằng
+#     khoảng trắng cũng là ranh giới: vẽ phần văn bản TRƯỚC nó rồi mới nhận delta.
+#   - hoặc bắt buộc vẽ nếu đã quá 2 khung hình mà chưa gặp ranh giới an toàn.
+# Không bao giờ sleep. Đồng thời đo thời gian tới mẩu đầu tiên (TTFT) và tốc độ token/giây.
+
+import time
+
+CURSOR = "▌"
+
+
+class StreamRenderer:
+    """
+    render: hàm nhận toàn bộ văn bản cần hiển thị (vd. placeholder.markdown)
+    started_at: time.perf_counter() lúc gửi yêu cầu (để tính TTFT); mặc định = lúc tạo
+    """
+
+    def __init__(self, render, max_fps=12, started_at=None):
+        self._render = render
+        self._frame_interval = 1.0 / max_fps
+        self._parts = []
+        self.started_at = time.perf_counter() if started_at is None else started_at
+        self.first_token_at = None
+        self.finished_at = None
+        self._last_flush = self.started_at
+        self.num_deltas = 0
+        self.num_renders = 0
+
+    @property
+    def text(self):
+        return "".join(self._parts)
+
+    def feed(self, delta):
+        """Nhận một mẩu văn bản; chỉ vẽ lại khi tới khung hình."""
+        if not delta:
+            return
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        self.num_deltas += 1
+
+        elapsed = now - self._last_flush
+        if elapsed >= self._frame_interval and delta[0].isspace() and self._parts:
+            self._flush(now, cursor=True) # Văn bản trước delta " từ" kết thúc ở ranh giới an toàn
+            self._parts.append(delta)
+            return
+        self._parts.append(delta)
+        at_safe_boundary = delta[-1].isspace()
+        if (elapsed >= self._frame_interval and at_safe_boundary) or elapsed >= 2 * self._frame_interval:
+            self._flush(now, cursor=True)
+
+    def finish(self):
+        """Vẽ lần cuối (không có con trỏ ▌) và trả về toàn bộ văn bản."""
+        self.finished_at = time.perf_counter()
+        self._flush(self.finished_at, cursor=False)
+        return self.text
+
+    def _flush(self, now, cursor):
+        text = "".join(self._parts)
+        self._parts = [text] # Gộp lại để lần join sau rẻ hơn
+        self._render(text + CURSOR if cursor else text)
+        self._last_flush = now
+        self.num_renders += 1
+
+    def stats(self):
+        """
+        Thống kê câu trả lời: ttft (giây tới mẩu đầu tiên), total (giây),
+        tokens (xấp xỉ bằng số delta của stream), tokens_per_sec (tính từ mẩu đầu tiên), renders.
+        """
+        end = self.finished_at or time.perf_counter()
+        ttft = None if self.first_token_at is None else self.first_token_at - self.started_at
+        gen_time = 0.0 if self.first_token_at is None else end - self.first_token_at
+        return {
+            "ttft": ttft,
+            "total": end - self.started_at,
+            "tokens": self.num_deltas,
+            "tokens_per_sec": self.num_deltas / gen_time if gen_time > 0 else 0.0,
+            "renders": self.num_renders,
+        }